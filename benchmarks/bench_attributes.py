@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Measures parse time and the memory held by the parsed tree for
+attribute-heavy documents: ``tests/res/pom.xml`` repeated many times, and
+generated SVG-like shapes with several attributes each.
+
+Usage: python benchmarks/bench_attributes.py [repetitions, default 2000]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import untangle
+
+POM = os.path.join(os.path.dirname(__file__), "..", "tests", "res", "pom.xml")
+
+
+def pom_document(repetitions):
+    with open(POM) as f:
+        project = f.read().split("?>", 1)[1]
+    return "<projects>%s</projects>" % (project * repetitions)
+
+
+def shapes_document(repetitions):
+    shape = (
+        '<rect x="%d" y="%d" width="30" height="30" fill="blue" stroke="black" '
+        'stroke-width="1" opacity="0.5"/>'
+    )
+    return "<svg>%s</svg>" % "".join(shape % (i, i) for i in range(repetitions * 20))
+
+
+def measure(doc):
+    start = time.perf_counter()
+    untangle.parse(doc)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    root = untangle.parse(doc)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del root
+    return seconds, size
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for label, doc in (
+        ("pom.xml", pom_document(repetitions)),
+        ("shapes", shapes_document(repetitions)),
+    ):
+        seconds, size = measure(doc)
+        megabytes = len(doc) / 2**20
+        print(
+            "%-8s %6.1f MB input, %6.2f s, %6.1f MB/s, tree %6.1f MB"
+            % (label, megabytes, seconds, megabytes / seconds, size / 2**20)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Compares the throughput of the default SAX backend with ``backend="expat"``
+and ``backend="lxml"`` on the generated corpora of ``bench_suite.py``.
+Without lxml installed, the lxml column measures its fallback to expat.
+
+Usage: python benchmarks/bench_backend.py [scale]
+"""
+
+import random
+import sys
+import time
+
+import untangle
+
+from bench_suite import CORPORA, SEED, best_time
+
+
+def main():
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    rng = random.Random(SEED)
+    if untangle.lxml is None:
+        print("lxml is not installed, backend='lxml' falls back to expat")
+    print("%-16s %10s %10s %10s" % ("corpus", "sax MB/s", "expat MB/s", "lxml MB/s"))
+    for name, generate in CORPORA:
+        documents = generate(rng, scale)
+        if isinstance(documents, str):
+            documents = [documents]
+        size = sum(len(doc.encode("utf-8")) for doc in documents)
+        throughput = {}
+        for backend in ("sax", "expat", "lxml"):
+            parser = untangle.Parser(backend=backend)
+            seconds = best_time(lambda: [parser.parse(doc) for doc in documents], 5)
+            throughput[backend] = size / seconds / 1e6
+        print(
+            "%-16s %10.2f %10.2f %10.2f"
+            % (name, throughput["sax"], throughput["expat"], throughput["lxml"])
+        )
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    main()
+    print("total %.1f s" % (time.perf_counter() - start))
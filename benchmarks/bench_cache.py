@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Parses the same generated response over and over, without a cache, with a
+copying ``ParseCache`` and with a sharing one, and prints the time per
+document.
+
+Usage: python benchmarks/bench_cache.py [number of records] [repetitions]
+"""
+
+import sys
+import time
+
+import untangle
+
+
+def make_document(records):
+    record = '<record id="%d" type="row"><name>name %d</name><value>42</value></record>'
+    return "<response>%s</response>" % "".join(record % (i, i) for i in range(records))
+
+
+def measure(doc, repetitions, **options):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        untangle.parse(doc, **options)
+    return (time.perf_counter() - start) / repetitions
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    doc = make_document(records)
+    print("no cache        %8.2f ms" % (measure(doc, repetitions) * 1e3))
+    for copy in (True, False):
+        cache = untangle.ParseCache(copy=copy)
+        seconds = measure(doc, repetitions, cache=cache)
+        print("cache copy=%-5s %7.2f ms  %s" % (copy, seconds * 1e3, cache.info()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Parses documents with a single, large text node made of many short lines
+(expat reports every line as a separate ``characters()`` call) and prints
+the parse time per MB. With linear cdata accumulation the time per MB stays
+flat as the text grows.
+
+Usage: python benchmarks/bench_cdata.py
+"""
+
+import timeit
+
+import untangle
+
+
+def make_document(size):
+    line = "QUJDREVGR0hJSktMTU5PUFFSU1RVVldYWVo=\n"
+    return "<root><payload>%s</payload></root>" % (line * (size // len(line)))
+
+
+def main():
+    for size in (2**20, 2**21, 2**22, 2**23):
+        doc = make_document(size)
+        seconds = min(timeit.repeat(lambda: untangle.parse(doc), number=1, repeat=3))
+        per_mb = seconds / (size / 2**20)
+        print("%5d KB text: %8.4f s, %8.4f s/MB" % (size // 1024, seconds, per_mb))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Compares turning a feed of ``<row>`` records into columns with
+``extract_columns()`` against building the tree with ``parse()`` or
+``iterparse()`` and looping over it.
+
+Usage: python benchmarks/bench_columns.py [number of records]
+"""
+
+import array
+import sys
+import timeit
+
+import untangle
+
+FIELDS = {"id": ("@id", "q"), "price": ("price", "d"), "name": "name"}
+
+
+def make_document(records):
+    row = '<row id="%d"><name>item %d</name><price>%d.5</price><stock>3</stock></row>'
+    return "<feed>%s</feed>" % "".join(row % (i, i, i) for i in range(records))
+
+
+def loop(rows):
+    ids, prices, names = array.array("q"), array.array("d"), []
+    for row in rows:
+        ids.append(int(row["id"]))
+        prices.append(float(row.price.cdata))
+        names.append(row.name.cdata)
+    return ids, prices, names
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    xml = make_document(records)
+    cases = [
+        ("parse() + loop", lambda: loop(untangle.parse(xml).feed.row)),
+        ("iterparse() + loop", lambda: loop(untangle.iterparse(xml, "row"))),
+        ("extract_columns()", lambda: untangle.extract_columns(xml, "row", FIELDS)),
+        (
+            "  backend='expat'",
+            lambda: untangle.extract_columns(xml, "row", FIELDS, backend="expat"),
+        ),
+    ]
+    for label, func in cases:
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print("%-22s %8.2f ms" % (label, seconds * 1e3))
+
+
+if __name__ == "__main__":
+    main()
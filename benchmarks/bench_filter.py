@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Parses a large SOAP-like response of which only a small part is needed,
+once completely and once with an ``include`` filter, and prints time and
+memory held by the resulting tree.
+
+Usage: python benchmarks/bench_filter.py [number of records]
+"""
+
+import sys
+import time
+import tracemalloc
+
+import untangle
+
+
+def make_document(records):
+    item = '<Item id="%d"><Name>item %d</Name></Item>'
+    result = "".join(item % (i, i) for i in range(100))
+    trace = "".join(
+        '<Entry level="debug"><Message>step %d</Message><Data>%s</Data></Entry>'
+        % (i, "x" * 64)
+        for i in range(records)
+    )
+    return (
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">'
+        "<soap:Body><Result>%s</Result><Trace>%s</Trace></soap:Body>"
+        "</soap:Envelope>" % (result, trace)
+    )
+
+
+def measure(doc, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    root = untangle.parse(doc, **kwargs)
+    seconds = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del root
+    return seconds, size
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    doc = make_document(records)
+    for label, kwargs in (
+        ("everything", {}),
+        ("include", {"include": ["Envelope/Body/Result/*"]}),
+    ):
+        seconds, size = measure(doc, **kwargs)
+        print("%-10s %6.2f s, tree %6.1f MB" % (label, seconds, size / 2**20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Walks every child of a wide element (thousands of differently named
+children) through ``__getattr__`` and ``get_elements()`` and prints the time
+per lookup, which should stay flat as the element grows.
+
+Usage: python benchmarks/bench_getattr.py
+"""
+
+import time
+
+import untangle
+
+
+def make_document(width):
+    return "<config>%s</config>" % "".join(
+        "<option%d>%d</option%d>" % (i, i, i) for i in range(width)
+    )
+
+
+def walk(doc, width, lookup):
+    root = untangle.parse(doc)
+    start = time.perf_counter()
+    for i in range(width):
+        lookup(root.config, "option%d" % i)
+    return time.perf_counter() - start
+
+
+def main():
+    for width in (1000, 4000, 16000):
+        doc = make_document(width)
+        for label, lookup in (
+            ("__getattr__", getattr),
+            ("get_elements", lambda e, name: e.get_elements(name)),
+        ):
+            seconds = walk(doc, width, lookup)
+            print(
+                "%6d children, %-12s %8.4f s, %6.2f us per lookup"
+                % (width, label, seconds, seconds / width * 1e6)
+            )
+
+
+if __name__ == "__main__":
+    main()
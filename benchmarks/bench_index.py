@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Looks up products by ``sku`` in a generated catalogue, once by scanning the
+children with ``get_attribute()`` and once through an ``AttributeIndex``,
+and prints the time per lookup and the cost of building the index.
+
+Usage: python benchmarks/bench_index.py [number of products]
+"""
+
+import random
+import sys
+import time
+
+import untangle
+
+
+def make_catalogue(products):
+    product = (
+        '<product sku="SKU%06d"><name>Product %d</name><price>%d</price></product>'
+    )
+    return "<catalogue>%s</catalogue>" % "".join(
+        product % (i, i, i % 100) for i in range(products)
+    )
+
+
+def scan(doc, sku):
+    for product in doc.catalogue.product:
+        if product.get_attribute("sku") == sku:
+            return product
+    return None
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    xml = make_catalogue(products)
+    skus = ["SKU%06d" % random.randrange(products) for _ in range(200)]
+
+    start = time.perf_counter()
+    doc = untangle.parse(xml)
+    print("parse                      %8.1f ms" % ((time.perf_counter() - start) * 1e3))
+
+    start = time.perf_counter()
+    index = untangle.AttributeIndex("product", "sku")
+    untangle.parse(xml, indexes=[index])
+    print("parse with index           %8.1f ms" % ((time.perf_counter() - start) * 1e3))
+
+    start = time.perf_counter()
+    index = doc.build_index("product", "sku")
+    print("build_index()              %8.1f ms" % ((time.perf_counter() - start) * 1e3))
+
+    start = time.perf_counter()
+    for sku in skus:
+        assert scan(doc, sku) is not None
+    seconds = (time.perf_counter() - start) / len(skus)
+    print("lookup by scan             %8.3f us" % (seconds * 1e6))
+
+    start = time.perf_counter()
+    for sku in skus * 1000:
+        assert index[sku] is not None
+    seconds = (time.perf_counter() - start) / len(skus) / 1000
+    print("lookup by index            %8.3f us" % (seconds * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Walks a generated document with ``Element.iter()`` and with a recursive
+generator, and measures what the ``max_depth`` option adds to parsing.
+
+Usage: python benchmarks/bench_iter.py [number of records]
+"""
+
+import sys
+import timeit
+
+import untangle
+
+
+def make_document(records):
+    record = "<record><name>n</name><values><v>1</v><v>2</v></values></record>"
+    return "<root>%s</root>" % (record * records)
+
+
+def walk(element):
+    yield element
+    for child in element.children:
+        yield from walk(child)
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    xml = make_document(records)
+    doc = untangle.parse(xml)
+    cases = [
+        ("recursive walk", lambda: sum(1 for _ in walk(doc))),
+        ("iter()", lambda: sum(1 for _ in doc.iter())),
+        ("iter('v')", lambda: sum(1 for _ in doc.iter("v"))),
+        ("parse()", lambda: untangle.parse(xml)),
+        ("parse(max_depth=100)", lambda: untangle.parse(xml, max_depth=100)),
+    ]
+    for label, func in cases:
+        seconds = min(timeit.repeat(func, number=3, repeat=3)) / 3
+        print("%-22s %8.2f ms" % (label, seconds * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Compares building a whole document with ``parse()`` against indexing it
+with ``parse(lazy=True)``, before and after a handful of its elements have
+been read, in time and retained memory.
+
+Usage: python benchmarks/bench_lazy.py [number of records]
+"""
+
+import gc
+import sys
+import timeit
+import tracemalloc
+
+import untangle
+
+
+def make_document(records):
+    record = '<record id="%d"><name>name %d</name><value>42</value><flag/></record>'
+    doc = "<root>%s</root>" % "".join(record % (i, i) for i in range(records))
+    return doc.encode()
+
+
+def touch(root):
+    records = root.root.record
+    for i in range(0, len(records), len(records) // 10):
+        records[i]["id"]
+        records[i].name.cdata
+    return root
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    doc = make_document(records)
+    cases = [
+        ("parse()", lambda: untangle.parse(doc)),
+        ("parse(lazy=True)", lambda: untangle.parse(doc, lazy=True)),
+        ("  + read 10 records", lambda: touch(untangle.parse(doc, lazy=True))),
+    ]
+    print("%d records, %.1f MB" % (records, len(doc) / 2**20))
+    for label, func in cases:
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        gc.collect()
+        tracemalloc.start()
+        root = func()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del root
+        print("%-22s %8.2f ms %8.1f MB" % (label, seconds * 1e3, size / 2**20))
+
+
+if __name__ == "__main__":
+    main()
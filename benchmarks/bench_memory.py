@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Compares the memory needed to hold a parsed document built out of
+``Element`` objects with the same document built out of ``CompactElement``
+objects.
+
+Usage: python benchmarks/bench_memory.py [number of records]
+"""
+
+import sys
+import tracemalloc
+
+import untangle
+
+
+def make_document(records):
+    record = '<record id="%d"><name>name</name><value>42</value><flag/></record>'
+    return "<root>%s</root>" % "".join(record % i for i in range(records))
+
+
+def measure(doc, **kwargs):
+    tracemalloc.start()
+    root = untangle.parse(doc, **kwargs)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del root
+    return size
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    doc = make_document(records)
+    nodes = records * 4 + 1
+    for label, kwargs in (("Element", {}), ("CompactElement", {"compact": True})):
+        size = measure(doc, **kwargs)
+        print(
+            "%-15s %8.1f MB, %6.1f bytes per node"
+            % (label, size / 2**20, size / float(nodes))
+        )
+
+
+if __name__ == "__main__":
+    main()
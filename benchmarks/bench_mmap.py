@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Generates a large XML file and compares the throughput of streaming it with
+``untangle.iterparse()`` through regular file reads and through a memory
+map.
+
+Usage: python benchmarks/bench_mmap.py [size in MB, default 256]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import untangle
+
+
+def write_document(path, size):
+    record = b'  <item id="%d"><name>product %d</name><price>9.99</price></item>\n'
+    with open(path, "wb") as f:
+        f.write(b"<feed>\n")
+        i = 0
+        while f.tell() < size:
+            f.write(b"".join(record % (j, j) for j in range(i, i + 1000)))
+            i += 1000
+        f.write(b"</feed>\n")
+
+
+def measure(path, **kwargs):
+    start = time.perf_counter()
+    count = sum(1 for _ in untangle.iterparse(path, tag="item", **kwargs))
+    return count, time.perf_counter() - start
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    fd, path = tempfile.mkstemp(suffix=".xml")
+    os.close(fd)
+    try:
+        write_document(path, size * 2**20)
+        megabytes = os.path.getsize(path) / 2**20
+        for label, kwargs in (("file reads", {}), ("mmap", {"mmap": True})):
+            count, seconds = measure(path, **kwargs)
+            print(
+                "%-10s %7d records, %6.2f s, %6.1f MB/s"
+                % (label, count, seconds, megabytes / seconds)
+            )
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Parses a directory of generated XML files one after another, with a thread
+pool and with a process pool through ``untangle.parse_many()``, and times
+pickling parsed trees, which is how the process pool returns them.
+
+Usage: python benchmarks/bench_parse_many.py [number of files, default 2000]
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import untangle
+
+
+def write_documents(directory, count):
+    record = '<entry id="%d"><name>entry %d</name><value>%d</value></entry>'
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, "doc%05d.xml" % i)
+        with open(path, "w") as f:
+            f.write("<feed>%s</feed>" % "".join(record % (j, j, j) for j in range(50)))
+        paths.append(path)
+    return paths
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_documents(directory, count)
+
+        start = time.perf_counter()
+        roots = [untangle.parse(path) for path in paths]
+        print("sequential   %6.2f s" % (time.perf_counter() - start))
+
+        for executor in ("thread", "process"):
+            start = time.perf_counter()
+            list(untangle.parse_many(paths, executor=executor))
+            print("%-12s %6.2f s" % (executor, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    data = [pickle.dumps(root, pickle.HIGHEST_PROTOCOL) for root in roots]
+    dumped = time.perf_counter() - start
+    start = time.perf_counter()
+    [pickle.loads(d) for d in data]
+    loaded = time.perf_counter() - start
+    print(
+        "pickle: %.1f KB per tree, dumps %6.2f s, loads %6.2f s"
+        % (sum(map(len, data)) / 1024.0 / count, dumped, loaded)
+    )
+
+
+if __name__ == "__main__":
+    main()
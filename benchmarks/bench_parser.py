@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Measures the per-call cost of parsing many ~1 KB documents with
+``untangle.parse()`` and with a reused ``untangle.Parser``.
+
+Usage: python benchmarks/bench_parser.py
+"""
+
+import timeit
+
+import untangle
+
+DOCUMENT = """<?xml version="1.0"?>
+<response status="ok">
+%s
+</response>""" % "\n".join(
+    '  <entry id="%d" type="item"><name>entry %d</name><value>%d</value></entry>'
+    % (i, i, i * 7)
+    for i in range(12)
+)
+
+
+def main():
+    print("document size: %d bytes" % len(DOCUMENT))
+    number = 5000
+    parser = untangle.Parser()
+    for label, func in (
+        ("untangle.parse()", lambda: untangle.parse(DOCUMENT)),
+        ("Parser.parse()", lambda: parser.parse(DOCUMENT)),
+    ):
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        print("%-18s %7.2f us per document" % (label, seconds / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Compares compiled ``find()``/``findall()`` queries with equivalent
+hand-written navigation over ``__getattr__`` and ``children`` on generated
+RSS and Atom feeds.
+
+Usage: python benchmarks/bench_query.py [number of items per feed]
+"""
+
+import sys
+import timeit
+
+import untangle
+
+
+def rss(items):
+    item = (
+        '<item id="%d"><title>Item %d</title><category>%s</category>'
+        "<description>Text</description></item>"
+    )
+    body = "".join(item % (i, i, "news" if i % 10 else "sports") for i in range(items))
+    return '<rss version="2.0"><channel><title>Feed</title>%s</channel></rss>' % body
+
+
+def atom(items):
+    entry = (
+        "<entry><id>urn:%d</id><title>Entry %d</title>"
+        '<link rel="alternate" href="http://example.com/%d"/>'
+        '<link rel="edit" href="http://example.com/%d/edit"/></entry>'
+    )
+    return '<feed xmlns="http://www.w3.org/2005/Atom">%s</feed>' % "".join(
+        entry % (i, i, i, i) for i in range(items)
+    )
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    feed = untangle.parse(rss(items))
+    target = str(items // 2)
+    atom_feed = untangle.parse(atom(items))
+    cases = [
+        (
+            "rss item by id",
+            lambda: feed.find("rss/channel/item[@id='%s']" % target),
+            lambda: next(i for i in feed.rss.channel.item if i["id"] == target),
+        ),
+        (
+            "rss titles by category",
+            lambda: feed.findall("rss/channel/item[category='sports']/title"),
+            lambda: [
+                i.title for i in feed.rss.channel.item if i.category.cdata == "sports"
+            ],
+        ),
+        (
+            "atom alternate links",
+            lambda: atom_feed.findall("feed/entry/link[@rel='alternate']"),
+            lambda: [
+                link
+                for entry in atom_feed.feed.entry
+                for link in entry.link
+                if link["rel"] == "alternate"
+            ],
+        ),
+    ]
+    for label, query, by_hand in cases:
+        for kind, func in (("query", query), ("by hand", by_hand)):
+            seconds = min(timeit.repeat(func, number=20, repeat=3)) / 20
+            print("%-24s %-8s %8.3f ms" % (label, kind, seconds * 1e3))
+
+
+if __name__ == "__main__":
+    main()
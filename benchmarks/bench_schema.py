@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Compares binding a feed to slotted dataclasses with ``parse(schema=...)``
+against building the tree with ``parse()`` and converting it by hand.
+
+Usage: python benchmarks/bench_schema.py [number of records]
+"""
+
+import dataclasses
+import sys
+import timeit
+
+import untangle
+
+
+@dataclasses.dataclass(slots=True)
+class Row:
+    id: int
+    name: str
+    price: float
+    stock: int = 0
+
+
+@dataclasses.dataclass(slots=True)
+class Feed:
+    row: list[Row]
+
+
+def make_document(records):
+    row = '<row id="%d"><name>item %d</name><price>%d.5</price><stock>3</stock></row>'
+    return "<feed>%s</feed>" % "".join(row % (i, i, i) for i in range(records))
+
+
+def convert(feed):
+    return Feed(
+        [
+            Row(
+                int(row["id"]),
+                row.name.cdata,
+                float(row.price.cdata),
+                int(row.stock.cdata),
+            )
+            for row in feed.row
+        ]
+    )
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    xml = make_document(records)
+    cases = [
+        ("parse() + convert", lambda: convert(untangle.parse(xml).feed)),
+        ("parse(schema=Feed)", lambda: untangle.parse(xml, schema=Feed)),
+        (
+            "  backend='expat'",
+            lambda: untangle.parse(xml, schema=Feed, backend="expat"),
+        ),
+        (
+            "iterparse(schema=Row)",
+            lambda: list(untangle.iterparse(xml, "row", schema=Row)),
+        ),
+    ]
+    for label, func in cases:
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print("%-22s %8.2f ms" % (label, seconds * 1e3))
+
+
+if __name__ == "__main__":
+    main()
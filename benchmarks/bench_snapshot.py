@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compares reloading a generated configuration document from a snapshot
+written by ``dump()`` with parsing the XML again (and with pickle), and
+prints the time taken and the size of each file.
+
+Usage: python benchmarks/bench_snapshot.py [number of entries]
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import untangle
+
+
+def make_document(entries):
+    entry = (
+        '<service name="svc%d" enabled="true" port="%d">'
+        '<endpoint url="http://localhost:%d/api" timeout="30"/>'
+        "<description>Service number %d</description></service>"
+    )
+    return "<config>%s</config>" % "".join(
+        entry % (i, 8000 + i, 8000 + i, i) for i in range(entries)
+    )
+
+
+def timed(label, path, func):
+    best = min(_time(func) for _ in range(3))
+    print("%-14s %8.1f ms %10d bytes" % (label, best * 1e3, os.path.getsize(path)))
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _time(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = os.path.join(tmp, "config.xml")
+        with open(xml_path, "w") as f:
+            f.write(make_document(entries))
+        doc = untangle.parse(xml_path)
+        snapshot_path = os.path.join(tmp, "config.snapshot")
+        untangle.dump(doc, snapshot_path)
+        pickle_path = os.path.join(tmp, "config.pickle")
+        with open(pickle_path, "wb") as f:
+            pickle.dump(doc, f, pickle.HIGHEST_PROTOCOL)
+
+        timed("parse()", xml_path, lambda: untangle.parse(xml_path))
+        timed("pickle.load()", pickle_path, lambda: load_pickle(pickle_path))
+        timed("load()", snapshot_path, lambda: untangle.load(snapshot_path))
+        timed(
+            "load(mmap)",
+            snapshot_path,
+            lambda: untangle.load(snapshot_path, mmap=True),
+        )
+
+
+if __name__ == "__main__":
+    main()
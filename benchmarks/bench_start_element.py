@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Profiles ``untangle.parse()`` on a document with a small, repeated tag
+vocabulary (including names which need sanitizing) and prints the cost per
+call of ``Handler.startElement``.
+
+Usage: python benchmarks/bench_start_element.py [number of records]
+"""
+
+import cProfile
+import pstats
+import sys
+import time
+
+import untangle
+
+
+def make_document(records):
+    record = (
+        '<soap:record-item id="%d"><item.name>n</item.name><class>c</class>'
+        "<value>%d</value></soap:record-item>"
+    )
+    return "<root>%s</root>" % "".join(record % (i, i) for i in range(records))
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    doc = make_document(records)
+
+    start = time.perf_counter()
+    untangle.parse(doc)
+    print("parse():        %6.3f s" % (time.perf_counter() - start))
+
+    profile = cProfile.Profile()
+    profile.runcall(untangle.parse, doc)
+    stats = pstats.Stats(profile).stats
+    for (filename, _, function), (_, calls, own, total, _) in stats.items():
+        if function == "startElement" and filename.endswith("__init__.py"):
+            print(
+                "startElement:   %6.3f us own, %6.3f us total per call (profiled)"
+                % (own / calls * 1e6, total / calls * 1e6)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for catching performance regressions in ``Handler`` and
+``Element`` before a release.
+
+Parses generated corpora (wide, deep, attribute-heavy, text-heavy,
+namespace-heavy and many small documents) and measures ``parse()``
+throughput in MB/s, peak and retained memory per node, and the cost of
+navigating with ``__getattr__`` and ``get_elements()``. Corpora are
+generated from a fixed seed, so every run parses the same data.
+
+Usage:
+    python benchmarks/bench_suite.py [--quick] [--json FILE]
+        runs the suite against the importable untangle and prints, and
+        optionally saves, the results
+    python benchmarks/bench_suite.py --compare BASELINE.json CURRENT.json
+        compares two saved runs
+    python benchmarks/bench_suite.py --against REV [--quick]
+        runs the suite against git revision REV and against the working
+        tree, and compares them
+
+Comparisons print the change of every metric and exit with status 1 if any
+of them got worse by more than ``--threshold`` percent (default 10).
+"""
+
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+SEED = 1234
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do".split()
+
+# metric suffix -> True if higher values are better
+METRICS = {
+    "parse_mb_s": True,
+    "peak_bytes_per_node": False,
+    "retained_bytes_per_node": False,
+    "getattr_ns": False,
+    "get_elements_ns": False,
+}
+
+
+def text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def wide(rng, scale):
+    names = ["item", "entry", "record", "row"]
+    return "<root>%s</root>" % "".join(
+        "<%s>%s</%s>" % (name, text(rng, 3), name)
+        for name in (rng.choice(names) for _ in range(20000 * scale))
+    )
+
+
+def deep(rng, scale):
+    depth = 100
+    chain = "".join("<level%d>" % i for i in range(depth))
+    chain += text(rng, 2)
+    chain += "".join("</level%d>" % i for i in reversed(range(depth)))
+    return "<root>%s</root>" % (chain * (100 * scale))
+
+
+def attribute_heavy(rng, scale):
+    def element(i):
+        attributes = " ".join(
+            'attr%d="%s"' % (j, rng.choice(WORDS)) for j in range(rng.randint(8, 16))
+        )
+        return '<product id="%d" %s/>' % (i, attributes)
+
+    return "<catalogue>%s</catalogue>" % "".join(
+        element(i) for i in range(5000 * scale)
+    )
+
+
+def text_heavy(rng, scale):
+    return "<book>%s</book>" % "".join(
+        "<p>%s &amp; %s</p>" % (text(rng, 200), text(rng, 50))
+        for _ in range(500 * scale)
+    )
+
+
+def namespace_heavy(rng, scale):
+    prefixes = ["soap", "wsa", "xsd", "xsi", "app"]
+    declarations = " ".join(
+        'xmlns:%s="http://example.com/%s"' % (prefix, prefix) for prefix in prefixes
+    )
+
+    def element():
+        prefix = rng.choice(prefixes)
+        return '<%s:Value %s:type="%s:string">%s</%s:Value>' % (
+            prefix,
+            rng.choice(prefixes),
+            rng.choice(prefixes),
+            text(rng, 2),
+            prefix,
+        )
+
+    return "<soap:Envelope %s><soap:Body>%s</soap:Body></soap:Envelope>" % (
+        declarations,
+        "".join(element() for _ in range(10000 * scale)),
+    )
+
+
+def many_small(rng, scale):
+    return [
+        '<response status="ok"><id>%d</id><name>%s</name></response>'
+        % (i, text(rng, 3))
+        for i in range(2000 * scale)
+    ]
+
+
+CORPORA = [
+    ("wide", wide),
+    ("deep", deep),
+    ("attribute_heavy", attribute_heavy),
+    ("text_heavy", text_heavy),
+    ("namespace_heavy", namespace_heavy),
+    ("many_small", many_small),
+]
+
+
+def count_nodes(roots):
+    count = 0
+    stack = list(roots)
+    while stack:
+        element = stack.pop()
+        count += 1
+        stack.extend(element.children)
+    return count
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_corpus(untangle, name, documents, repeat):
+    size = sum(len(doc.encode("utf-8")) for doc in documents)
+
+    def parse_all():
+        return [untangle.parse(doc) for doc in documents]
+
+    seconds = best_time(parse_all, repeat)
+
+    gc.collect()
+    tracemalloc.start()
+    roots = parse_all()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nodes = count_nodes(roots)
+    return {
+        name + ".parse_mb_s": size / seconds / 1e6,
+        name + ".peak_bytes_per_node": peak / nodes,
+        name + ".retained_bytes_per_node": retained / nodes,
+    }
+
+
+def bench_access(untangle, scale, repeat):
+    records = 2000 * scale
+    doc = untangle.parse(
+        "<root>%s</root>"
+        % "".join(
+            '<record id="%d"><name>n</name><value>v</value><flag/></record>' % i
+            for i in range(records)
+        )
+    )
+    items = doc.root.record
+
+    def navigate():
+        for record in items:
+            record.name
+            record.value
+            record.flag
+
+    def get_elements():
+        for record in items:
+            record.get_elements("name")
+            record.get_elements("value")
+            record.get_elements("flag")
+
+    accesses = 3 * records
+    return {
+        "access.getattr_ns": best_time(navigate, repeat) / accesses * 1e9,
+        "access.get_elements_ns": best_time(get_elements, repeat) / accesses * 1e9,
+    }
+
+
+def run(scale, repeat):
+    import untangle
+
+    rng = random.Random(SEED)
+    results = {}
+    for name, generate in CORPORA:
+        documents = generate(rng, scale)
+        if isinstance(documents, str):
+            documents = [documents]
+        results.update(bench_corpus(untangle, name, documents, repeat))
+    results.update(bench_access(untangle, scale, repeat))
+    return {
+        "meta": {
+            "untangle": os.path.dirname(untangle.__file__),
+            "commit": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "scale": scale,
+        },
+        "results": results,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def unit(metric):
+    return metric.rsplit(".", 1)[1]
+
+
+def print_results(run):
+    print("untangle from %(untangle)s (%(commit)s), Python %(python)s" % run["meta"])
+    for metric, value in run["results"].items():
+        print("  %-40s %12.2f" % (metric, value))
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints the change of every metric and returns the regressed ones.
+    """
+    print("baseline: %(commit)s, Python %(python)s" % baseline["meta"])
+    print("current:  %(commit)s, Python %(python)s" % current["meta"])
+    regressions = []
+    for metric, new in current["results"].items():
+        old = baseline["results"].get(metric)
+        if not old:
+            print("  %-40s %12.2f  (new)" % (metric, new))
+            continue
+        change = (new - old) / old * 100
+        worse = -change if METRICS[unit(metric)] else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(metric)
+            flag = "  REGRESSION"
+        print("  %-40s %12.2f -> %12.2f  %+6.1f%%%s" % (metric, old, new, change, flag))
+    return regressions
+
+
+def run_against(revision, args):
+    """
+    Runs the suite in subprocesses against ``revision`` and the working
+    tree, and returns both runs.
+    """
+    options = ["--quick"] if args.quick else []
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = subprocess.run(
+            ["git", "archive", revision, "src"],
+            cwd=ROOT,
+            capture_output=True,
+            check=True,
+        ).stdout
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(tmp)
+        runs = []
+        for label, src in ((revision, os.path.join(tmp, "src")), (None, "src")):
+            output = os.path.join(tmp, "run.json")
+            env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, src))
+            subprocess.run(
+                [sys.executable, __file__, "--json", output] + options,
+                env=env,
+                check=True,
+            )
+            with open(output) as f:
+                result = json.load(f)
+            if label is not None:
+                result["meta"]["commit"] = label
+            runs.append(result)
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--quick", action="store_true", help="use small corpora")
+    parser.add_argument("--json", metavar="FILE", help="save the results to FILE")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"))
+    parser.add_argument("--against", metavar="REV", help="compare with git REV")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.compare:
+        runs = []
+        for path in args.compare:
+            with open(path) as f:
+                runs.append(json.load(f))
+    elif args.against:
+        runs = run_against(args.against, args)
+    else:
+        result = run(scale=1 if args.quick else 4, repeat=3 if args.quick else 5)
+        print_results(result)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(result, f, indent=2)
+        return 0
+    return 1 if compare(runs[0], runs[1], args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Parses a pretty-printed feed with the default cdata handling and with
+``strip_whitespace=True`` and prints parse time, the number of allocated
+blocks and the memory held by the tree.
+
+Usage: python benchmarks/bench_whitespace.py [number of records]
+"""
+
+import sys
+import time
+import tracemalloc
+
+import untangle
+
+
+def make_document(records):
+    record = """  <item id="%d">
+    <title>Item %d</title>
+    <description>
+      A longer description
+      spanning several lines.
+    </description>
+    <tags>
+      <tag>a</tag>
+      <tag>b</tag>
+    </tags>
+  </item>
+"""
+    return "<feed>\n%s</feed>\n" % "".join(record % (i, i) for i in range(records))
+
+
+def measure(doc, **kwargs):
+    start = time.perf_counter()
+    untangle.parse(doc, **kwargs)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    root = untangle.parse(doc, **kwargs)
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = snapshot.statistics("filename")
+    del root
+    return seconds, sum(s.count for s in stats), sum(s.size for s in stats)
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    doc = make_document(records)
+    for label, kwargs in (
+        ("default", {}),
+        ("strip_whitespace", {"strip_whitespace": True}),
+    ):
+        seconds, blocks, size = measure(doc, **kwargs)
+        print(
+            "%-17s %6.2f s, %8d blocks, tree %6.1f MB"
+            % (label, seconds, blocks, size / 2**20)
+        )
+
+
+if __name__ == "__main__":
+    main()
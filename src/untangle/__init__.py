@@ -12,12 +12,40 @@ Author: Christian Stefanescu (http://0chris.com)
 License: MIT License - http://www.opensource.org/licenses/mit-license.php
 """
 
+import array
+import asyncio
+import codecs
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
+import dataclasses
+import functools
+import gc
+import hashlib
 import os
+import re
 import keyword
+import sys
+import mmap
+import pickle
+import struct
+import threading
+import types
+import typing
+from defusedxml.common import EntitiesForbidden, ExternalReferenceForbidden
 from defusedxml.sax import make_parser
+import xml.parsers.expat
 import xml.sax
+import xml.sax.expatreader
 import xml.sax.xmlreader
 import xml.sax.handler
+import xml.sax.saxutils
+
+try:
+    import lxml.etree
+except ImportError:  # optional, backend="lxml" falls back to "expat"
+    lxml = None
 
 from io import StringIO
 
@@ -26,32 +54,114 @@ def is_string(x):
     return isinstance(x, str)
 
 
+def is_bytes(x):
+    return isinstance(x, (bytes, bytearray, memoryview, mmap.mmap))
+
+
 __version__ = "1.2.1"
 
+# number of characters/bytes read from a source per parser.feed() call
+BUFFER_SIZE = 2**16
+# number of bytes of a memory-mapped file passed per parser.feed() call
+MMAP_CHUNK_SIZE = 2**20
+
+# maximum number of distinct element names kept by sanitize_name()
+NAME_CACHE_SIZE = 4096
 
-class Element(object):
+_NAME_CACHE = {}
+_NULL_HANDLER = xml.sax.handler.ContentHandler()
+# backend used when none is given, see parse()
+DEFAULT_BACKEND = "sax"
+
+# snapshot files written by dump(): a header with the element, layout and
+# string counts, followed by int32 arrays and the NUL separated strings
+_SNAPSHOT_MAGIC = b"untangle"
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<8sHHiiiiQ")
+_SNAPSHOT_IS_ROOT = 1
+_SNAPSHOT_COMPACT = 2
+
+
+class CompactElement(object):
     """
-    Representation of an XML element.
+    Memory-lean representation of an XML element.
+
+    Behaves like ``Element`` but uses ``__slots__`` instead of an instance
+    ``__dict__``, so arbitrary attributes cannot be set on it.
     """
 
+    __slots__ = (
+        "_name",
+        "_attributes",
+        "children",
+        "is_root",
+        "_cdata",
+        "_cdata_parts",
+        "_index",
+    )
+
     def __init__(self, name, attributes):
         self._name = name
         self._attributes = attributes
         self.children = []
         self.is_root = False
-        self.cdata = ""
+        self._cdata = ""
+        self._cdata_parts = None
+        self._index = None
+
+    @property
+    def cdata(self):
+        """
+        Text content of this element
+        """
+        if self._cdata_parts is not None:
+            self.join_cdata()
+        return self._cdata
+
+    @cdata.setter
+    def cdata(self, value):
+        self._cdata = value
+        self._cdata_parts = None
 
     def add_child(self, element):
         """
         Store child elements.
         """
         self.children.append(element)
+        if self._index is not None:
+            self._index.setdefault(element._name, []).append(element)
+
+    def _children_named(self, name):
+        """
+        Children called ``name``, looked up in a name index which is built on
+        first use and kept up to date by ``add_child()``.
+        """
+        if self._index is None:
+            index = {}
+            for child in self.children:
+                index.setdefault(child._name, []).append(child)
+            self._index = index
+        return self._index.get(name)
 
     def add_cdata(self, cdata):
         """
-        Store cdata
+        Store cdata. Chunks are buffered and only joined by ``join_cdata()``
+        (or the first read of ``cdata``) to avoid quadratic concatenation.
+        """
+        if self._cdata_parts is None:
+            if not self._cdata:
+                self._cdata = cdata
+                return
+            self._cdata_parts = [self._cdata]
+        self._cdata_parts.append(cdata)
+
+    def join_cdata(self):
+        """
+        Join buffered cdata chunks into a single string
         """
-        self.cdata = self.cdata + cdata
+        if self._cdata_parts is not None:
+            self._cdata = "".join(self._cdata_parts)
+            self._cdata_parts = None
 
     def get_attribute(self, key):
         """
@@ -64,29 +174,80 @@ class Element(object):
         Find a child element by name
         """
         if name:
-            return [e for e in self.children if e._name == name]
+            return list(self._children_named(name) or ())
         else:
             return self.children
 
+    def iter(self, tag=None):
+        """
+        Iterate over this element and all its descendants in document order,
+        or only over those named ``tag``, without recursion
+        """
+        if tag is not None:
+            tag = sanitize_name(tag)
+        if tag is None or self._name == tag:
+            yield self
+        stack = [iter(self.children)]
+        while stack:
+            for element in stack[-1]:
+                if tag is None or element._name == tag:
+                    yield element
+                if element.children:
+                    stack.append(iter(element.children))
+                    break
+            else:
+                stack.pop()
+
+    def build_index(self, tag, attr):
+        """
+        Index the descendants named ``tag`` by their ``attr`` attribute, see
+        ``AttributeIndex``
+        """
+        index = AttributeIndex(tag, attr)
+        stack = list(reversed(self.children))
+        while stack:
+            element = stack.pop()
+            if element._name == index.tag:
+                index.add(element)
+            stack.extend(reversed(element.children))
+        return index
+
+    def find(self, path):
+        """
+        Find the first element matching ``path``, or ``None``, see ``Query``
+        """
+        return next(compile_query(path).iterfind(self), None)
+
+    def findall(self, path):
+        """
+        Find all elements matching ``path``, see ``Query``
+        """
+        return list(compile_query(path).iterfind(self))
+
+    def iterfind(self, path):
+        """
+        Iterate over the elements matching ``path``, see ``Query``
+        """
+        return compile_query(path).iterfind(self)
+
     def __getitem__(self, key):
         return self.get_attribute(key)
 
     def __getattr__(self, key):
-        matching_children = [x for x in self.children if x._name == key]
+        if key in CompactElement.__slots__:
+            # unset slot, e.g. while copying or unpickling
+            raise AttributeError(key)
+        matching_children = self._children_named(key)
         if matching_children:
             if len(matching_children) == 1:
-                self.__dict__[key] = matching_children[0]
                 return matching_children[0]
             else:
-                self.__dict__[key] = matching_children
-                return matching_children
+                return list(matching_children)
         else:
             raise AttributeError("'%s' has no attribute '%s'" % (self._name, key))
 
     def __hasattribute__(self, name):
-        if name in self.__dict__:
-            return True
-        return any(x._name == name for x in self.children)
+        return bool(self._children_named(name))
 
     def __iter__(self):
         yield self
@@ -124,85 +285,2675 @@ class Element(object):
     def __contains__(self, key):
         return key in dir(self)
 
+    def __reduce__(self):
+        # pickles the subtree as flat lists instead of nested objects, which
+        # is smaller, faster and does not hit the recursion limit
+        return (_unflatten, (type(self), self.is_root) + _flatten(self))
+
+
+class Query(object):
+    """
+    A compiled path expression, used by ``find()``, ``findall()`` and
+    ``iterfind()``.
+
+    Paths are relative to the element they are applied to and consist of
+    steps separated by ``/``:
+
+    * ``name`` selects the children called ``name``; raw and sanitized
+      names are both accepted
+    * ``*`` selects all children, ``.`` the element itself
+    * ``//`` selects descendants instead of children, as in ``.//item``
+
+    Each step may be followed by predicates in brackets:
+
+    * ``[@attr]`` and ``[@attr='value']`` test an attribute
+    * ``[name]`` and ``[name='text']`` test for a child (with the given
+      cdata), ``[.='text']`` tests the element's own cdata
+    * ``[2]`` and ``[last()]`` select by position, counted per parent
+
+    Raises ``ValueError`` for invalid or unsupported paths.
+    """
+
+    _STEP = re.compile(r"(//|/)?([^/\[\]]+)((?:\[[^\]]*\])*)")
+    _PREDICATE = re.compile(r"\[([^\]]*)\]")
+    _HAS_ATTRIBUTE = re.compile(r"\s*@([^=\s]+)\s*$")
+    _ATTRIBUTE_EQUALS = re.compile(r"\s*@([^=\s]+)\s*=\s*(['\"])(.*)\2\s*$")
+    _HAS_CHILD = re.compile(r"\s*([^=\s@'\"]+)\s*$")
+    _CHILD_EQUALS = re.compile(r"\s*([^=\s@'\"]+)\s*=\s*(['\"])(.*)\2\s*$")
+    _POSITION = re.compile(r"\s*(\d+|last\(\))\s*$")
+
+    def __init__(self, path):
+        self.path = path
+        self.steps = []
+        if path.startswith("/") and not path.startswith("//"):
+            raise ValueError("absolute paths are not supported: %r" % path)
+        position = 0
+        while position < len(path):
+            match = self._STEP.match(path, position)
+            if match is None or (position and not match.group(1)):
+                raise ValueError("invalid path: %r" % path)
+            axis, name, predicates = match.groups()
+            name = name.strip()
+            if name == ".." or (name == "." and axis == "//"):
+                raise ValueError("unsupported step %r in %r" % (name, path))
+            if name not in ("*", "."):
+                name = sanitize_name(name)
+            predicates = [
+                self._compile_predicate(predicate, path)
+                for predicate in self._PREDICATE.findall(predicates)
+            ]
+            self.steps.append((axis == "//", name, predicates))
+            position = match.end()
+        if not self.steps:
+            raise ValueError("empty path")
+
+    def _compile_predicate(self, predicate, path):
+        match = self._POSITION.match(predicate)
+        if match:
+            if match.group(1) == "last()":
+                return lambda elements: elements[-1:]
+            index = int(match.group(1)) - 1
+            if index < 0:
+                raise ValueError("positions start at 1: %r" % path)
+            return lambda elements: elements[index : index + 1]
+        match = self._HAS_ATTRIBUTE.match(predicate)
+        if match:
+            key = match.group(1)
+            return lambda elements: [e for e in elements if key in e._attributes]
+        match = self._ATTRIBUTE_EQUALS.match(predicate)
+        if match:
+            key, value = match.group(1), match.group(3)
+            return lambda elements: [
+                e for e in elements if e._attributes.get(key) == value
+            ]
+        match = self._CHILD_EQUALS.match(predicate)
+        if match:
+            name, value = match.group(1), match.group(3)
+            if name == ".":
+                return lambda elements: [e for e in elements if e.cdata == value]
+            name = sanitize_name(name)
+            return lambda elements: [
+                e
+                for e in elements
+                if any(c.cdata == value for c in e._children_named(name) or ())
+            ]
+        match = self._HAS_CHILD.match(predicate)
+        if match:
+            name = sanitize_name(match.group(1))
+            return lambda elements: [e for e in elements if e._children_named(name)]
+        raise ValueError("unsupported predicate [%s] in %r" % (predicate, path))
+
+    @staticmethod
+    def _select(element, descendants, name):
+        if not descendants:
+            if name == ".":
+                return [element]
+            if name == "*":
+                return element.children
+            return element._children_named(name) or []
+        selected = []
+        stack = list(reversed(element.children))
+        while stack:
+            child = stack.pop()
+            if name == "*" or child._name == name:
+                selected.append(child)
+            stack.extend(reversed(child.children))
+        return selected
+
+    @staticmethod
+    def _filter_per_parent(element, elements, name, predicates):
+        """
+        Applies ``predicates`` to the descendants of ``element`` called
+        ``name`` of each parent separately, and keeps those of ``elements``
+        which match, in document order.
+        """
+        matching = set()
+        stack = [element]
+        while stack:
+            parent = stack.pop()
+            children = parent.children
+            group = children
+            if name != "*":
+                group = [c for c in children if c._name == name]
+            for predicate in predicates:
+                group = predicate(group)
+            matching.update(map(id, group))
+            stack.extend(children)
+        return [e for e in elements if id(e) in matching]
+
+    def iterfind(self, element):
+        """
+        Yields the elements matching this query, starting at ``element``
+        """
+        contexts = [element]
+        last = len(self.steps) - 1
+        for i, (descendants, name, predicates) in enumerate(self.steps):
+            selected = []
+            seen = set() if descendants and len(contexts) > 1 else None
+            for context in contexts:
+                elements = self._select(context, descendants, name)
+                if descendants and predicates:
+                    elements = self._filter_per_parent(
+                        context, elements, name, predicates
+                    )
+                else:
+                    for predicate in predicates:
+                        elements = predicate(elements)
+                if i == last and seen is None:
+                    yield from elements
+                    continue
+                for e in elements:
+                    if seen is not None:
+                        if id(e) in seen:
+                            continue
+                        seen.add(id(e))
+                    selected.append(e)
+            if i == last:
+                yield from selected
+            contexts = selected
+
+
+@functools.lru_cache(maxsize=256)
+def compile_query(path):
+    """
+    Compiles ``path`` into a ``Query``. Compiled queries are cached.
+    """
+    return Query(path)
+
+
+def _flatten(element):
+    """
+    Lists the names, attributes, cdata and number of children of
+    ``element`` and its descendants, in document order.
+    """
+    names, attributes, cdatas, sizes = [], [], [], []
+    stack = [element]
+    while stack:
+        element = stack.pop()
+        names.append(element._name)
+        attributes.append(element._attributes)
+        cdatas.append(element.cdata)
+        sizes.append(len(element.children))
+        stack.extend(reversed(element.children))
+    return names, attributes, cdatas, sizes
+
+
+def _unflatten(element_class, is_root, names, attributes, cdatas, sizes):
+    root = None
+    pending = []
+    for name, attrs, cdata, size in zip(names, attributes, cdatas, sizes):
+        element = element_class(name, attrs)
+        element._cdata = cdata
+        if pending:
+            parent = pending[-1]
+            parent[0].children.append(element)
+            parent[1] -= 1
+            if not parent[1]:
+                pending.pop()
+        else:
+            root = element
+        if size:
+            pending.append([element, size])
+    root.is_root = is_root
+    return root
+
+
+class Element(CompactElement):
+    """
+    Representation of an XML element.
+
+    Child lookups by attribute are memoized in the instance ``__dict__``,
+    which makes repeated navigation as fast as a plain attribute access.
+    """
+
+    def add_child(self, element):
+        """
+        Store child elements.
+        """
+        CompactElement.add_child(self, element)
+        # lookups are only memoized once the index exists
+        if self._index is not None:
+            self.__dict__.pop(element._name, None)
+
+    def __getattr__(self, key):
+        value = CompactElement.__getattr__(self, key)
+        self.__dict__[key] = value
+        return value
+
+
+class LazyElement(Element):
+    """
+    Element of a document parsed with ``lazy=True``.
+
+    Only knows its name and position in the document at first. Its
+    children, attributes and cdata are read from the document when they are
+    first accessed, and kept from then on. Default attribute values declared
+    in a DTD are not applied.
+    """
+
+    __slots__ = ("_document", "_position")
+
+    def __init__(self, document, position):
+        self._name = document.names[document.name_ids[position]]
+        self.is_root = not position
+        self._cdata_parts = None
+        self._index = None
+        self._document = document
+        self._position = position
+
+    def __getattr__(self, key):
+        if key == "children":
+            self.children = [
+                LazyElement(self._document, child)
+                for child in self._document.children(self._position)
+            ]
+            return self.children
+        if key == "_attributes":
+            self._attributes = self._document.attributes(self._position)
+            return self._attributes
+        if key == "_cdata":
+            self._cdata = self._document.cdata(self._position)
+            return self._cdata
+        return Element.__getattr__(self, key)
+
+    def __reduce__(self):
+        # pickled and copied as a fully built tree of Elements, without the
+        # document
+        return (_unflatten, (Element, self.is_root) + _flatten(self))
+
+
+class Attributes(collections.abc.Mapping):
+    """
+    Read-only mapping of an element's attributes.
+
+    Stores only a tuple of values; the key -> position map is shared by all
+    elements which have the same attribute names, so repetitive documents
+    need one small tuple per element instead of a dictionary.
+    """
+
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def get(self, key, default=None):
+        position = self._index.get(key)
+        if position is None:
+            return default
+        return self._values[position]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+NO_ATTRIBUTES = Attributes({}, ())
+
+
+class AttributeIndex(collections.abc.Mapping):
+    """
+    Maps the values of the attribute ``attr`` to the elements named ``tag``
+    which carry it, for constant-time lookups such as "the ``<product>``
+    with ``sku="X"``": ::
+
+        products = doc.build_index("product", "sku")
+        products["X"].name.cdata
+
+    Looking up a value returns the first such element in document order,
+    ``getall()`` returns all of them. Elements without the attribute are
+    not indexed. ``tag`` is matched against the sanitized element name.
+
+    Indexes are built from a parsed tree with ``Element.build_index()``, or
+    filled while parsing by passing them to ``parse(indexes=[...])``.
+    """
+
+    __slots__ = ("tag", "attr", "_first", "_more")
+
+    def __init__(self, tag, attr):
+        self.tag = sanitize_name(tag)
+        self.attr = attr
+        self._first = {}
+        # value -> further elements, for values which are not unique
+        self._more = {}
+
+    def add(self, element):
+        """
+        Index ``element`` under the value of its ``attr`` attribute
+        """
+        value = element.get_attribute(self.attr)
+        if value is None:
+            return
+        if value in self._first:
+            self._more.setdefault(value, []).append(element)
+        else:
+            self._first[value] = element
+
+    def getall(self, value):
+        """
+        All elements with the given value, in document order
+        """
+        element = self._first.get(value)
+        if element is None:
+            return []
+        return [element] + self._more.get(value, [])
+
+    def __getitem__(self, value):
+        return self._first[value]
+
+    def get(self, value, default=None):
+        return self._first.get(value, default)
+
+    def __contains__(self, value):
+        return value in self._first
+
+    def __iter__(self):
+        return iter(self._first)
+
+    def __len__(self):
+        return len(self._first)
+
+    def __repr__(self):
+        return "AttributeIndex(tag = %s, attr = %s, values = %d)" % (
+            self.tag,
+            self.attr,
+            len(self._first),
+        )
+
+
+def sanitize_name(name):
+    """
+    Turns an XML element name into the Python attribute name it is
+    accessible by: ``-``, ``.`` and ``:`` are replaced by ``_`` and a
+    trailing ``_`` is added to Python keywords.
+
+    Results are interned and cached, so documents pay for this once per
+    distinct tag name.
+    """
+    sanitized = _NAME_CACHE.get(name)
+    if sanitized is not None:
+        return sanitized
+    sanitized = name.replace("-", "_")
+    sanitized = sanitized.replace(".", "_")
+    sanitized = sanitized.replace(":", "_")
+
+    # adding trailing _ for keywords
+    if keyword.iskeyword(sanitized):
+        sanitized += "_"
+
+    sanitized = sys.intern(sanitized)
+    if len(_NAME_CACHE) >= NAME_CACHE_SIZE:
+        _NAME_CACHE.clear()
+    _NAME_CACHE[name] = sanitized
+    return sanitized
+
+
+class PathFilter(object):
+    """
+    Selects the parts of a document to build, given ``include`` and
+    ``exclude`` lists of element paths.
+
+    Paths are relative to the document, e.g. ``"Envelope/Body/Result"``.
+    Each step matches an element by its raw name, its sanitized name or
+    its name without namespace prefix, or any element if it is ``*``.
+    Matching elements are kept or skipped along with their whole subtree.
+    If ``include`` is given, only elements inside an included subtree and
+    their ancestors are built, and only included subtrees keep their
+    cdata.
+
+    A filter holds no per-document state and can be shared.
+    """
+
+    def __init__(self, include=None, exclude=None):
+        self.include = [self._compile(path) for path in include or ()]
+        self.exclude = [self._compile(path) for path in exclude or ()]
+        self.initial = (
+            0,
+            tuple(range(len(self.include))) if self.include else None,
+            tuple(range(len(self.exclude))),
+        )
+
+    @staticmethod
+    def _compile(path):
+        return tuple(path.strip("/").split("/"))
+
+    @staticmethod
+    def _step_matches(step, name, sanitized):
+        return (
+            step == "*"
+            or step == name
+            or step == sanitized
+            or step == name.rpartition(":")[2]
+        )
+
+    def enter(self, state, name, sanitized):
+        """
+        Returns the state for a child element of an element in ``state``,
+        or ``None`` if the child is to be skipped. A state's second item is
+        ``None`` inside of included subtrees.
+        """
+        depth, include, exclude = state
+        excluding = []
+        for i in exclude:
+            path = self.exclude[i]
+            if self._step_matches(path[depth], name, sanitized):
+                if len(path) == depth + 1:
+                    return None
+                excluding.append(i)
+        if include is not None:
+            including = []
+            for i in include:
+                path = self.include[i]
+                if self._step_matches(path[depth], name, sanitized):
+                    if len(path) == depth + 1:
+                        including = None
+                        break
+                    including.append(i)
+            if including == []:
+                return None
+            include = None if including is None else tuple(including)
+        return depth + 1, include, tuple(excluding)
+
 
 class Handler(xml.sax.handler.ContentHandler):
     """
     SAX handler which creates the Python object structure out of ``Element``s
+
+    If a ``PathFilter`` is given, elements it rejects are skipped without
+    being built. Every built element is added to the matching
+    ``AttributeIndex`` objects in ``indexes``. ``strip_whitespace`` and
+    ``max_depth`` are described in ``parse()``.
     """
 
-    def __init__(self):
-        self.root = Element(None, None)
+    def __init__(
+        self,
+        element_class=None,
+        path_filter=None,
+        strip_whitespace=False,
+        indexes=(),
+        max_depth=None,
+    ):
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.element_class = element_class or Element
+        self.root = self.element_class(None, None)
         self.root.is_root = True
         self.elements = []
+        # key -> position maps shared by all elements with the same
+        # attribute names in the same order
+        self._attribute_indexes = {}
+        self.path_filter = path_filter
+        # filter states of the open elements
+        self._states = [path_filter.initial] if path_filter else None
+        # number of open elements inside a skipped subtree
+        self._skipped = 0
+        self.strip_whitespace = strip_whitespace
+        self.max_depth = max_depth
+        # sanitized tag -> attribute indexes to fill
+        self._indexes = None
+        if indexes:
+            self._indexes = {}
+            for index in indexes:
+                self._indexes.setdefault(index.tag, []).append(index)
 
     def startElement(self, name: str, attrs: xml.sax.xmlreader.AttributesImpl) -> None:
-        name = name.replace("-", "_")
-        name = name.replace(".", "_")
-        name = name.replace(":", "_")
-
-        # adding trailing _ for keywords
-        if keyword.iskeyword(name):
-            name += "_"
-
-        attrs_dict = dict()
-        for k, v in attrs.items():
-            attrs_dict[k] = v
-        element = Element(name, attrs_dict)
-        element = Element(name, attrs)
-        if len(self.elements) > 0:
+        if (
+            self.max_depth is not None
+            and len(self.elements) + self._skipped >= self.max_depth
+        ):
+            raise xml.sax.SAXParseException(
+                "maximum depth of %d exceeded" % self.max_depth, None, self._locator
+            )
+        if self._skipped:
+            self._skipped += 1
+            return
+        sanitized = _NAME_CACHE.get(name) or sanitize_name(name)
+        if self.path_filter is not None:
+            state = self.path_filter.enter(self._states[-1], name, sanitized)
+            if state is None:
+                self._skipped = 1
+                return
+            self._states.append(state)
+        name = sanitized
+
+        if attrs:
+            keys = tuple(attrs.keys())
+            index = self._attribute_indexes.get(keys)
+            if index is None:
+                index = self._attribute_indexes[keys] = {
+                    key: i for i, key in enumerate(keys)
+                }
+            attributes = Attributes(index, tuple(attrs.values()))
+        else:
+            attributes = NO_ATTRIBUTES
+        element = self.element_class(name, attributes)
+        if self.elements:
             self.elements[-1].add_child(element)
         else:
             self.root.add_child(element)
         self.elements.append(element)
+        if self._indexes is not None:
+            for index in self._indexes.get(name, ()):
+                index.add(element)
 
     def endElement(self, name):
-        self.elements.pop()
+        if self._skipped:
+            self._skipped -= 1
+            return
+        if self._states is not None:
+            self._states.pop()
+        element = self.elements.pop()
+        if self.strip_whitespace:
+            _strip_trailing_whitespace(element)
+        element.join_cdata()
 
     def characters(self, content: str) -> None:
+        if self._skipped:
+            return
+        if self._states is not None and self._states[-1][1] is not None:
+            # outside of the included subtrees
+            return
         if self.elements:
-            self.elements[-1].add_cdata(content)
+            element = self.elements[-1]
+            if self.strip_whitespace and not element._cdata:
+                # nothing but whitespace so far, which is dropped
+                content = content.lstrip()
+                if not content:
+                    return
+            element.add_cdata(content)
+
 
+def _strip_trailing_whitespace(element):
+    parts = element._cdata_parts
+    if parts is None:
+        element._cdata = element._cdata.rstrip()
+        return
+    while parts and parts[-1].isspace():
+        parts.pop()
+    parts[-1] = parts[-1].rstrip()
 
-def parse(filename, **parser_features):
+
+class StreamHandler(Handler):
+    """
+    SAX handler which collects every completed element called ``tag`` and
+    detaches it from its parent, so that only the element currently being
+    built (and its ancestors) is kept in memory. An element called ``tag``
+    inside another one is collected too, but stays a child of the outer one.
     """
-    Interprets the given string as a filename, URL or XML data string,
-    parses it and returns a Python object which represents the given
-    document.
 
-    Extra arguments to this function are treated as feature values that are
-    passed to ``parser.setFeature()``. For example, ``feature_external_ges=False``
-    will set ``xml.sax.handler.feature_external_ges`` to False, disabling
-    the parser's inclusion of external general (text) entities such as DTDs.
+    def __init__(self, tag, **options):
+        Handler.__init__(self, **options)
+        self.tag = tag
+        self.completed = []
+        self._open = 0
 
-    Raises ``ValueError`` if the first argument is None / empty string.
+    def _matches(self, name, element):
+        return name == self.tag or element._name == self.tag
 
-    Raises ``AttributeError`` if a requested xml.sax feature is not found in
-    ``xml.sax.handler``.
+    def startElement(self, name: str, attrs: xml.sax.xmlreader.AttributesImpl) -> None:
+        Handler.startElement(self, name, attrs)
+        if not self._skipped and self._matches(name, self.elements[-1]):
+            self._open += 1
 
-    Raises ``xml.sax.SAXParseException`` if something goes wrong
-    during parsing.
+    def endElement(self, name):
+        if self._skipped:
+            Handler.endElement(self, name)
+            return
+        element = self.elements[-1]
+        Handler.endElement(self, name)
+        matched = self._matches(name, element)
+        if matched:
+            self._open -= 1
+        # matches nested in another match stay part of it; elements outside
+        # of a match can never be reached by the caller, so they are dropped
+        if not self._open:
+            parent = self.elements[-1] if self.elements else self.root
+            parent.children.pop()
+            parent._index = None
+        if matched:
+            self.completed.append(element)
 
-    Raises ``defusedxml.common.EntitiesForbidden``
-    or ``defusedxml.common.ExternalReferenceForbidden``
-    when a potentially malicious entity load is attempted. See also
-    https://github.com/tiran/defusedxml#attack-vectors
+    def characters(self, content: str) -> None:
+        if self._open:
+            Handler.characters(self, content)
+
+
+class PushHandler(Handler):
     """
-    if filename is None or (is_string(filename) and filename.strip()) == "":
-        raise ValueError("parse() takes a filename, URL or XML string")
-    parser = make_parser()
-    for feature, value in parser_features.items():
-        parser.setFeature(getattr(xml.sax.handler, feature), value)
-    sax_handler = Handler()
-    parser.setContentHandler(sax_handler)
-    if is_string(filename) and (os.path.exists(filename) or is_url(filename)):
-        parser.parse(filename)
-    else:
-        if hasattr(filename, "read"):
-            parser.parse(filename)
+    SAX handler which builds the same structure as ``Handler`` and calls the
+    callbacks registered for an element name whenever such an element is
+    complete.
+    """
+
+    def __init__(self, **options):
+        Handler.__init__(self, **options)
+        self.callbacks = {}
+
+    def endElement(self, name):
+        if self._skipped:
+            Handler.endElement(self, name)
+            return
+        element = self.elements[-1]
+        Handler.endElement(self, name)
+        callbacks = self.callbacks.get(name, [])
+        if element._name != name:
+            callbacks = callbacks + self.callbacks.get(element._name, [])
+        for callback in callbacks:
+            callback(element)
+
+
+class ColumnHandler(xml.sax.handler.ContentHandler):
+    """
+    SAX handler which appends the fields of every element called ``record``
+    to ``columns``, a dictionary of lists and arrays, without building any
+    elements. ``fields`` is described in ``extract_columns()``.
+
+    Records nested in a record are part of the outer one.
+    """
+
+    def __init__(self, record, fields, max_depth=None):
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.record = record
+        self.max_depth = max_depth
+        self.columns = {}
+        # the paths of all fields as a tree of _FieldNode objects
+        self._fields = _FieldNode()
+        # (append, convert, default, name) per column
+        self._outputs = []
+        for name, spec in fields.items():
+            path, attribute, column, convert, default = _compile_field(spec)
+            node = self._fields
+            for step in path:
+                node = node.children.setdefault(step, _FieldNode())
+            if attribute:
+                node.attributes.append((attribute, len(self._outputs)))
+            else:
+                node.text.append(len(self._outputs))
+            self.columns[name] = column
+            self._outputs.append((column.append, convert, default, name))
+        # (node, text parts) per open element of the current record
+        self._open = []
+        self._values = None
+        self._depth = 0
+        self._count = 0
+
+    def startElement(self, name: str, attrs: xml.sax.xmlreader.AttributesImpl) -> None:
+        self._depth += 1
+        if self.max_depth is not None and self._depth > self.max_depth:
+            raise xml.sax.SAXParseException(
+                "maximum depth of %d exceeded" % self.max_depth, None, self._locator
+            )
+        if self._open:
+            parent = self._open[-1][0]
+            if parent is None:
+                self._open.append((None, None))
+                return
+            node = parent.children.get(name, _MISSING)
+            if node is _MISSING:
+                # looked up by sanitized name, and remembered by raw name
+                node = parent.children[name] = parent.children.get(
+                    _NAME_CACHE.get(name) or sanitize_name(name)
+                )
+            if node is None:
+                self._open.append((None, None))
+                return
+        elif name == self.record or sanitize_name(name) == self.record:
+            node = self._fields
+            self._values = [_MISSING] * len(self._outputs)
+        else:
+            return
+        values = self._values
+        for attribute, column in node.attributes:
+            if values[column] is _MISSING:
+                value = attrs.get(attribute)
+                if value is not None:
+                    values[column] = value
+        self._open.append((node, [] if node.text else None))
+
+    def endElement(self, name):
+        self._depth -= 1
+        if not self._open:
+            return
+        node, parts = self._open.pop()
+        if parts is not None:
+            values = self._values
+            text = "".join(parts)
+            for column in node.text:
+                if values[column] is _MISSING:
+                    values[column] = text
+        if not self._open:
+            self._add_record()
+
+    def characters(self, content: str) -> None:
+        if self._open:
+            parts = self._open[-1][1]
+            if parts is not None:
+                parts.append(content)
+
+    def _add_record(self):
+        for value, (append, convert, default, name) in zip(self._values, self._outputs):
+            if value is _MISSING:
+                if default is _MISSING:
+                    raise ValueError(
+                        "record %d has no value for %r" % (self._count, name)
+                    )
+                append(default)
+            elif convert is None:
+                append(value)
+            else:
+                try:
+                    append(convert(value))
+                except (TypeError, ValueError, OverflowError) as e:
+                    raise ValueError(
+                        "record %d has an invalid value for %r: %s"
+                        % (self._count, name, e)
+                    ) from e
+        self._values = None
+        self._count += 1
+
+
+class _FieldNode(object):
+    """
+    Step of a field path in ``ColumnHandler``: the columns which take the
+    text or attributes of the element it matches, and the following steps.
+    """
+
+    __slots__ = ("children", "attributes", "text")
+
+    def __init__(self):
+        self.children = {}
+        self.attributes = []
+        self.text = []
+
+
+_MISSING = object()
+
+_INTEGER_TYPECODES = "bBhHiIlLqQ"
+_FLOAT_TYPECODES = "fd"
+
+
+def _compile_field(spec):
+    """
+    Splits a field of ``extract_columns()`` into its path, attribute name,
+    empty column, conversion and default value.
+    """
+
+    def unpack(path, kind=None, default=_MISSING):
+        return path, kind, default
+
+    path, kind, default = unpack(*((spec,) if is_string(spec) else spec))
+    steps, at, attribute = path.partition("@")
+    steps = tuple(step for step in steps.split("/") if step not in ("", "."))
+    if (
+        (at and not attribute)
+        or "/" in attribute
+        or not (steps or attribute or path.strip("/") == ".")
+    ):
+        raise ValueError("invalid field path %r" % path)
+    if kind is None or callable(kind):
+        if default is _MISSING:
+            default = None
+        return steps, attribute, [], kind, default
+    if kind in _INTEGER_TYPECODES:
+        return steps, attribute, array.array(kind), int, default
+    if kind in _FLOAT_TYPECODES:
+        return steps, attribute, array.array(kind), float, default
+    raise ValueError(
+        "field type must be callable or one of %r, not %r"
+        % (_INTEGER_TYPECODES + _FLOAT_TYPECODES, kind)
+    )
+
+
+class SchemaHandler(xml.sax.handler.ContentHandler):
+    """
+    SAX handler which binds the document element to an instance of the
+    dataclass ``schema`` while parsing, without building any elements. If
+    ``tag`` is given, every element named ``tag`` is bound instead, and
+    collected in ``completed``.
+
+    Fields are bound by name, raw or sanitized. A field whose type is a
+    dataclass takes the first child element of that name, and a ``list``
+    of such a type takes all of them. Other fields take the attribute of
+    that name, or else the text of the first child element of that name,
+    or of all of them for a ``list``, converted to the field's type;
+    ``bool`` accepts ``true``, ``false``, ``1`` and ``0``. A path in the
+    field's ``untangle`` metadata selects something else: ``"@name"`` an
+    attribute, ``"name"`` a child element and ``"."`` the element's own
+    text, e.g. ``field(metadata={"untangle": "@id"})``.
+
+    Fields without a value keep their default, or get ``None`` if they are
+    optional or ``[]`` if they are lists; ``ValueError`` is raised if they
+    have none of these, or if a value can't be converted. How a dataclass is
+    bound is worked out once and cached.
+    """
+
+    def __init__(self, schema, tag=None, strip_whitespace=False, max_depth=None):
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.plan = _schema_plan(schema)
+        self.tag = tag
+        self.strip_whitespace = strip_whitespace
+        self.max_depth = max_depth
+        self.result = None
+        self.completed = []
+        # (field, plan, values, text parts) per open bound element; plan
+        # and values are None for elements bound to a plain value
+        self._open = []
+        # number of open elements which are not bound
+        self._skipped = 0
+        self._depth = 0
+
+    def startElement(self, name: str, attrs: xml.sax.xmlreader.AttributesImpl) -> None:
+        self._depth += 1
+        if self.max_depth is not None and self._depth > self.max_depth:
+            raise xml.sax.SAXParseException(
+                "maximum depth of %d exceeded" % self.max_depth, None, self._locator
+            )
+        if self._skipped:
+            self._skipped += 1
+            return
+        if not self._open:
+            if self.tag is not None and (
+                name != self.tag and sanitize_name(name) != self.tag
+            ):
+                return
+            field, plan = None, self.plan
+        else:
+            parent_plan, parent_values = self._open[-1][1:3]
+            field = None
+            if parent_plan is not None:
+                field = parent_plan.children.get(name, _MISSING)
+                if field is _MISSING:
+                    # looked up by sanitized name, and remembered by raw name
+                    field = parent_plan.children[name] = parent_plan.children.get(
+                        _NAME_CACHE.get(name) or sanitize_name(name)
+                    )
+            if field is None or (
+                not field.many and parent_values[field.index] is not _MISSING
+            ):
+                self._skipped = 1
+                return
+            if field.schema is None:
+                self._open.append((field, None, None, []))
+                return
+            plan = _schema_plan(field.schema)
+        values = [_MISSING] * len(plan.fields)
+        for attribute, attribute_field in plan.attributes:
+            value = attrs.get(attribute)
+            if value is not None:
+                values[attribute_field.index] = self._convert(attribute_field, value)
+        self._open.append((field, plan, values, None if plan.text is None else []))
+
+    def endElement(self, name):
+        self._depth -= 1
+        if self._skipped:
+            self._skipped -= 1
+            return
+        if not self._open:
+            return
+        field, plan, values, parts = self._open.pop()
+        if plan is None:
+            value = self._convert(field, "".join(parts))
         else:
-            parser.parse(StringIO(filename))
+            if parts is not None and values[plan.text.index] is _MISSING:
+                values[plan.text.index] = self._convert(plan.text, "".join(parts))
+            value = plan.build(values)
+        if field is None:
+            if self.tag is None:
+                self.result = value
+            else:
+                self.completed.append(value)
+            return
+        parent_values = self._open[-1][2]
+        if not field.many:
+            parent_values[field.index] = value
+        elif parent_values[field.index] is _MISSING:
+            parent_values[field.index] = [value]
+        else:
+            parent_values[field.index].append(value)
+
+    def characters(self, content: str) -> None:
+        if self._open and not self._skipped:
+            parts = self._open[-1][3]
+            if parts is not None:
+                parts.append(content)
 
-    return sax_handler.root
+    def _convert(self, field, value):
+        if self.strip_whitespace:
+            value = value.strip()
+        if field.convert is None:
+            return value
+        try:
+            return field.convert(value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(
+                "invalid value %r for field %r of %s: %s"
+                % (value, field.name, field.owner.__name__, e)
+            ) from e
+
+
+class _SchemaPlan(object):
+    """
+    How elements are bound to the dataclass ``schema``: its fields, the
+    fields which take attributes and the element's own text, and the
+    fields which take child elements by element name.
+    """
+
+    __slots__ = ("schema", "fields", "attributes", "text", "children")
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.fields = []
+        self.attributes = []
+        self.text = None
+        self.children = {}
+
+    def build(self, values):
+        """
+        Creates an instance of ``schema`` out of the values of its fields
+        """
+        kwargs = {}
+        for field, value in zip(self.fields, values):
+            if value is _MISSING:
+                if field.has_default:
+                    continue
+                if not (field.many or field.optional):
+                    raise ValueError(
+                        "missing value for field %r of %s"
+                        % (field.name, self.schema.__name__)
+                    )
+                value = [] if field.many else None
+            kwargs[field.name] = value
+        return self.schema(**kwargs)
+
+
+class _SchemaField(object):
+    """
+    Field of a ``_SchemaPlan``. ``schema`` is the dataclass of nested
+    elements, and ``convert`` turns text into the field's type otherwise.
+    """
+
+    __slots__ = (
+        "owner",
+        "name",
+        "index",
+        "convert",
+        "schema",
+        "many",
+        "optional",
+        "has_default",
+    )
+
+    def __init__(self, owner, field, index, hint):
+        self.owner = owner
+        self.name = field.name
+        self.index = index
+        hint, self.optional, self.many = _unwrap_type(hint)
+        if isinstance(hint, type) and dataclasses.is_dataclass(hint):
+            self.schema, self.convert = hint, None
+        else:
+            self.schema, self.convert = None, _converter(hint)
+        self.has_default = (
+            field.default is not dataclasses.MISSING
+            or field.default_factory is not dataclasses.MISSING
+        )
+
+
+@functools.lru_cache(maxsize=256)
+def _schema_plan(schema):
+    """
+    Compiles the ``_SchemaPlan`` of the dataclass ``schema``. Plans are
+    cached, so their reflection is done once per class.
+    """
+    if not (isinstance(schema, type) and dataclasses.is_dataclass(schema)):
+        raise TypeError("schema must be a dataclass, not %r" % (schema,))
+    hints = typing.get_type_hints(schema)
+    plan = _SchemaPlan(schema)
+    for field in dataclasses.fields(schema):
+        if not field.init:
+            continue
+        binding = _SchemaField(schema, field, len(plan.fields), hints[field.name])
+        plan.fields.append(binding)
+        scalar = binding.schema is None and not binding.many
+        path = field.metadata.get("untangle")
+        if path is None:
+            plan.children[field.name] = binding
+            if scalar:
+                plan.attributes.append((field.name, binding))
+        elif path == "." and scalar:
+            plan.text = binding
+        elif path.startswith("@") and scalar and len(path) > 1:
+            plan.attributes.append((path[1:], binding))
+        elif path and path != "." and not set(path) & set("/@"):
+            plan.children[path] = binding
+        else:
+            raise ValueError(
+                "invalid path %r for field %r of %s"
+                % (path, field.name, schema.__name__)
+            )
+    return plan
+
+
+def _unwrap_type(hint):
+    """
+    Returns the type of the values of a field annotated with ``hint``, and
+    whether the annotation is optional and whether it is a list.
+    """
+    optional = many = False
+    if typing.get_origin(hint) in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        if len(args) == 1:
+            optional, hint = True, args[0]
+    if hint is list or typing.get_origin(hint) is list:
+        many = True
+        hint = (typing.get_args(hint) or (str,))[0]
+    return hint, optional, many
+
+
+def _converter(hint):
+    if hint is bool:
+        return _to_bool
+    if hint is str or hint is typing.Any or not callable(hint):
+        return None
+    return hint
+
+
+def _to_bool(value):
+    value = value.strip()
+    if value in ("true", "1"):
+        return True
+    if value in ("false", "0"):
+        return False
+    raise ValueError("not a boolean: %r" % value)
+
+
+class ExpatReader(object):
+    """
+    Reader for ``backend="expat"``, which drives pyexpat directly instead of
+    going through ``xml.sax.expatreader``.
+
+    The content handler's ``startElement()``, ``endElement()`` and
+    ``characters()`` are called straight from pyexpat, with the attributes
+    as a plain ``dict``, and adjacent text is reported in a single
+    ``characters()`` call. Like ``defusedxml``, it raises
+    ``EntitiesForbidden`` on entity declarations and
+    ``ExternalReferenceForbidden`` on external references, including
+    external DTDs.
+
+    Provides the ``feed()``/``close()`` interface of SAX readers.
+    """
+
+    def __init__(self):
+        self._handler = _NULL_HANDLER
+        self._source = xml.sax.xmlreader.InputSource()
+        self._parser = None
+        self._parsing = False
+
+    def setContentHandler(self, handler):
+        self._handler = handler
+
+    def setFeature(self, name, state):
+        if name in (
+            xml.sax.handler.feature_external_ges,
+            xml.sax.handler.feature_string_interning,
+        ):
+            # external references are always forbidden, names always interned
+            return
+        if name in (
+            xml.sax.handler.feature_namespaces,
+            xml.sax.handler.feature_namespace_prefixes,
+            xml.sax.handler.feature_validation,
+            xml.sax.handler.feature_external_pes,
+        ):
+            if state:
+                raise xml.sax.SAXNotSupportedException(
+                    "Feature '%s' not supported by this backend" % name
+                )
+            return
+        raise xml.sax.SAXNotRecognizedException("Feature '%s' not recognized" % name)
+
+    def _start(self):
+        parser = _create_expat_parser(self._source.getEncoding())
+        parser.buffer_text = True
+        parser.buffer_size = BUFFER_SIZE
+        handler = self._handler
+        parser.StartElementHandler = handler.startElement
+        parser.EndElementHandler = handler.endElement
+        parser.CharacterDataHandler = handler.characters
+        self._parser = parser
+        self._parsing = True
+        handler.startDocument()
+
+    def feed(self, data, final=False):
+        if not self._parsing:
+            self._start()
+        try:
+            self._parser.Parse(data, final)
+        except xml.parsers.expat.ExpatError as e:
+            raise xml.sax.SAXParseException(
+                xml.parsers.expat.ErrorString(e.code),
+                e,
+                xml.sax.expatreader.ExpatLocator(self),
+            )
+
+    def close(self):
+        self.feed(b"", True)
+        self._handler.endDocument()
+        self._parsing = False
+        # the parser's callbacks would keep the document alive
+        self._parser = None
+
+
+class LxmlReader(object):
+    """
+    Reader for ``backend="lxml"``, which parses with lxml's C parser and
+    passes the elements it builds to the content handler.
+
+    lxml builds a tree of the document as it is fed, in which every element
+    is passed to the content handler once its start tag, and once its end
+    tag is read. Text is passed before the next element starts or ends, and
+    elements are removed from the tree when they have been passed on, so
+    that the tree never holds more than the open elements and their
+    last children.
+
+    Names are reported with their namespace prefix and namespace
+    declarations as ``xmlns`` attributes, as the ``xml.sax`` reader does,
+    so documents are built the same way as with the other backends, except
+    that declarations are listed before the other attributes. Entity
+    declarations raise ``EntitiesForbidden`` and external DTDs
+    ``ExternalReferenceForbidden``, and neither is ever loaded; anything
+    looking like an entity declaration before the root element is
+    rejected, which is why only ASCII compatible encodings, such as UTF-8,
+    are supported. libxml2's limits apply, e.g. documents can be nested at
+    most 256 levels deep.
+
+    Passing every element on from lxml costs more than expat's callbacks,
+    so this is slower than ``ExpatReader``.
+
+    Only available if lxml is installed; ``backend="lxml"`` falls back to
+    ``ExpatReader`` otherwise. Supports the same parser features as
+    ``ExpatReader``. Serves as its own locator, which knows the source but
+    not the position in it.
+    """
+
+    _ENTITY = b"<!ENTITY"
+    _EVENTS = ("start", "end", "start-ns", "end-ns")
+
+    def __init__(self):
+        self._handler = _NULL_HANDLER
+        self._source = xml.sax.xmlreader.InputSource()
+        self._parser = None
+        self._encoding = None
+        # start of the document, until its encoding can be checked
+        self._head = b""
+        self._started = False
+        # end of the previous chunk, for declarations split across chunks
+        self._tail = b""
+        # open elements, with their names and last child so far
+        self._open = []
+        # uri -> prefixes currently declared, and the declarations made by
+        # the next start tag and by the open elements
+        self._prefixes = {}
+        self._declarations = []
+        self._declared = []
+
+    setContentHandler = ExpatReader.setContentHandler
+    setFeature = ExpatReader.setFeature
+
+    def _start(self, text):
+        # str is fed as UTF-8, whatever its declaration says
+        self._encoding = "utf-8" if text else self._source.getEncoding()
+        self._parser = lxml.etree.XMLPullParser(
+            events=self._EVENTS,
+            encoding=self._encoding,
+            # declarations are rejected in feed(), this leaves any which
+            # get through unexpanded
+            resolve_entities=False,
+            load_dtd=False,
+            no_network=True,
+            remove_comments=True,
+            remove_pis=True,
+        )
+        self._head = b""
+        self._started = False
+        self._tail = b""
+        self._open.clear()
+        self._prefixes = {"http://www.w3.org/XML/1998/namespace": ["xml"]}
+        self._declarations.clear()
+        self._declared.clear()
+        self._handler.startDocument()
+
+    def _check_encoding(self, head):
+        """
+        Makes sure that "<!ENTITY" can be found in the raw document, i.e.
+        that it is in an encoding in which ASCII characters are written as
+        ASCII, which e.g. UTF-16 and UTF-7 are not.
+        """
+        encoding = self._encoding
+        if head.startswith(codecs.BOM_UTF8):
+            head = head[len(codecs.BOM_UTF8) :]
+            encoding = encoding or "utf-8"
+        if head[:1].isspace() or head[:1] == b"<":
+            if encoding is None:
+                match = _XML_DECLARATION.match(head)
+                encoding = match.group(1).decode("ascii") if match else "utf-8"
+            try:
+                if _ASCII.decode(encoding) == _ASCII.decode("ascii"):
+                    return
+            except (LookupError, UnicodeDecodeError):
+                pass
+        elif not head:
+            return
+        raise ValueError(
+            "backend='lxml' only supports ASCII compatible encodings, such as UTF-8"
+        )
+
+    def feed(self, data):
+        if self._parser is None:
+            self._start(isinstance(data, str))
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        elif not isinstance(data, bytes):
+            data = bytes(data)
+        if self._head is not None:
+            # the declaration can only be checked once it is complete
+            data = self._head + data
+            if b">" not in data:
+                self._head = data
+                return
+            self._check_encoding(data)
+            self._head = None
+        if not self._started:
+            # declarations can only precede the root element
+            window = self._tail + data
+            if self._ENTITY in window:
+                raise EntitiesForbidden(None, None, None, None, None, None)
+            self._tail = window[-len(self._ENTITY) :]
+        try:
+            self._parser.feed(data)
+        except lxml.etree.XMLSyntaxError as e:
+            raise self._error(e, self._parser.feed_error_log)
+        self._read_events()
+
+    def close(self):
+        if self._parser is None:
+            self._start(False)
+        # the tree would keep the document alive
+        parser, self._parser = self._parser, None
+        head, self._head = self._head, None
+        if head is not None:
+            self._check_encoding(head)
+        try:
+            if head:
+                parser.feed(head)
+            parser.close()
+        except lxml.etree.XMLSyntaxError as e:
+            # libxml2 drops undeclared prefixes only from names it reports
+            # as namespace errors, the tree keeps them as written
+            if any(
+                error.domain != lxml.etree.ErrorDomains.NAMESPACE
+                or error.level == lxml.etree.ErrorLevels.FATAL
+                for error in parser.feed_error_log
+            ):
+                raise self._error(e, parser.feed_error_log)
+        try:
+            self._read_events(parser)
+        finally:
+            self._open.clear()
+        self._handler.endDocument()
+
+    def _read_events(self, parser=None):
+        handler = self._handler
+        open_elements = self._open
+        for event, element in (parser or self._parser).read_events():
+            if event == "start":
+                if open_elements:
+                    self._characters(open_elements[-1])
+                    open_elements[-1][2] = element
+                else:
+                    self._start_document(element)
+                name = self._name(element)
+                handler.startElement(name, self._attributes(element))
+                open_elements.append([element, name, None])
+            elif event == "end":
+                entry = open_elements.pop()
+                self._characters(entry)
+                handler.endElement(entry[1])
+            elif event == "start-ns":
+                prefix, uri = element
+                self._prefixes.setdefault(uri, []).append(prefix)
+                self._declared.append(uri)
+                self._declarations.append(
+                    ("xmlns:" + prefix if prefix else "xmlns", uri)
+                )
+            else:
+                self._prefixes[self._declared.pop()].pop()
+
+    def _start_document(self, root):
+        self._started = True
+        docinfo = root.getroottree().docinfo
+        if docinfo.system_url:
+            raise ExternalReferenceForbidden(
+                None, None, docinfo.system_url, docinfo.public_id
+            )
+        dtd = docinfo.internalDTD
+        if dtd is not None:
+            for entity in dtd.entities():
+                raise EntitiesForbidden(
+                    entity.name, entity.content, None, None, None, None
+                )
+
+    def _characters(self, entry):
+        """
+        Passes on the text after an open element's start tag or last child.
+        """
+        element, name, child = entry
+        if child is None:
+            text = element.text
+        else:
+            text = child.tail
+            # the only child left, its predecessors are removed already
+            del element[0]
+        if text:
+            self._handler.characters(text)
+
+    def _name(self, element):
+        tag = element.tag
+        if tag[0] != "{":
+            # no namespace, or a prefix which is not declared
+            return tag
+        name = tag[tag.index("}") + 1 :]
+        prefix = element.prefix
+        return prefix + ":" + name if prefix else name
+
+    def _attributes(self, element):
+        attributes = dict(self._declarations)
+        self._declarations.clear()
+        for key, value in element.items():
+            if key[0] == "{":
+                uri, key = key[1:].split("}", 1)
+                prefixes = self._prefixes.get(uri)
+                if prefixes and prefixes[-1]:
+                    key = prefixes[-1] + ":" + key
+            attributes[key] = value
+        return attributes
+
+    def _error(self, e, log):
+        # libxml2 may report namespace errors before the fatal one
+        for error in log:
+            if error.level == lxml.etree.ErrorLevels.FATAL:
+                return xml.sax.SAXParseException(
+                    error.message, e, _Position(self._source, error.line, error.column)
+                )
+        line, column = e.position
+        return xml.sax.SAXParseException(
+            e.msg, e, _Position(self._source, line, column)
+        )
+
+    def getColumnNumber(self):
+        return None
+
+    def getLineNumber(self):
+        return None
+
+    def getPublicId(self):
+        return self._source.getPublicId()
+
+    def getSystemId(self):
+        return self._source.getSystemId()
+
+
+class _Position(xml.sax.xmlreader.Locator):
+    """
+    Locator for errors which are not reported by a SAX reader, such as
+    lxml's.
+    """
+
+    def __init__(self, source, line=None, column=None):
+        self._source = source
+        self._line = line
+        self._column = column
+
+    def getColumnNumber(self):
+        return self._column
+
+    def getLineNumber(self):
+        return self._line
+
+    def getPublicId(self):
+        return self._source.getPublicId()
+
+    def getSystemId(self):
+        return self._source.getSystemId()
+
+
+# every ASCII character, as bytes
+_ASCII = bytes(range(128))
+# encoding of the XML declaration at the start of a document
+_XML_DECLARATION = re.compile(rb"""<\?xml[^>]*?\sencoding\s*=\s*["']([^"']*)["']""")
+
+
+def _forbid_entity_decl(name, is_parameter, value, base, sysid, pubid, notation):
+    raise EntitiesForbidden(name, value, base, sysid, pubid, notation)
+
+
+def _forbid_unparsed_entity_decl(name, base, sysid, pubid, notation):
+    raise EntitiesForbidden(name, None, base, sysid, pubid, notation)
+
+
+def _forbid_external_reference(context, base, sysid, pubid):
+    raise ExternalReferenceForbidden(context, base, sysid, pubid)
+
+
+def _create_expat_parser(encoding=None):
+    """
+    Creates a pyexpat parser which raises the ``defusedxml`` exceptions on
+    entity declarations and external references.
+    """
+    parser = xml.parsers.expat.ParserCreate(encoding)
+    parser.EntityDeclHandler = _forbid_entity_decl
+    parser.UnparsedEntityDeclHandler = _forbid_unparsed_entity_decl
+    parser.ExternalEntityRefHandler = _forbid_external_reference
+    parser.SetParamEntityParsing(
+        xml.parsers.expat.XML_PARAM_ENTITY_PARSING_UNLESS_STANDALONE
+    )
+    return parser
+
+
+_READERS = {"sax": make_parser, "expat": ExpatReader, "lxml": LxmlReader}
+
+# start tag of an element, the group matches "/" if it has no content
+_START_TAG = re.compile(
+    rb"""<[^\s/>]+(?:\s+[^\s=]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*(/?)>"""
+)
+_END_TAG = re.compile(rb"[^>]*>")
+
+
+class _LazyDocument(object):
+    """
+    Document parsed with ``lazy=True``: its data and a structural index,
+    out of which ``LazyElement`` objects are built on demand.
+
+    The index holds four arrays with an entry per element, in document
+    order: the byte offsets of its start and end tag, the position of its
+    name in ``names`` and the position after its last descendant. Position
+    0 is the document root. An element's first child is at the next
+    position, and every further child at the position after the previous
+    child's last descendant.
+    """
+
+    def __init__(self, data, encoding=None, system_id=None, max_depth=None):
+        self.data = memoryview(data).cast("B")
+        self.encoding = encoding
+        self.source = xml.sax.xmlreader.InputSource(system_id)
+        self.names = [None]
+        self.starts = array.array("q", [0])
+        self.ends = array.array("q", [0])
+        self.name_ids = array.array("i", [0])
+        self.after = array.array("i", [0])
+        # key -> position maps shared by all elements with the same
+        # attribute names in the same order
+        self._attribute_indexes = {}
+        self._index(max_depth)
+
+    def _index(self, max_depth):
+        data, names = self.data, self.names
+        ends, name_ids, after = self.ends, self.name_ids, self.after
+        # bound methods, called once per element
+        add_start, add_end = self.starts.append, ends.append
+        add_name, add_after = name_ids.append, after.append
+        # raw name -> position in names
+        known_names = {}
+        open_elements = [0]
+        push, pop = open_elements.append, open_elements.pop
+        parser = _create_expat_parser(self.encoding)
+        parser.ordered_attributes = True
+
+        def start(name, attrs):
+            if max_depth is not None and len(open_elements) > max_depth:
+                raise xml.sax.SAXParseException(
+                    "maximum depth of %d exceeded" % max_depth,
+                    None,
+                    _Position(
+                        self.source,
+                        parser.CurrentLineNumber,
+                        parser.CurrentColumnNumber,
+                    ),
+                )
+            name_id = known_names.get(name)
+            if name_id is None:
+                name_id = known_names[name] = len(names)
+                names.append(_NAME_CACHE.get(name) or sanitize_name(name))
+            push(len(name_ids))
+            add_start(parser.CurrentByteIndex)
+            add_end(0)
+            add_name(name_id)
+            add_after(0)
+
+        def end(name):
+            position = pop()
+            # the end tag's offset, only meaningful if there is one
+            ends[position] = parser.CurrentByteIndex
+            after[position] = len(name_ids)
+
+        def declaration(version, encoding, standalone):
+            if self.encoding is None:
+                self.encoding = encoding
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.XmlDeclHandler = declaration
+        try:
+            for offset in range(0, len(data), MMAP_CHUNK_SIZE):
+                with data[offset : offset + MMAP_CHUNK_SIZE] as chunk:
+                    parser.Parse(chunk, False)
+            parser.Parse(b"", True)
+        except xml.parsers.expat.ExpatError as e:
+            raise xml.sax.SAXParseException(
+                xml.parsers.expat.ErrorString(e.code),
+                e,
+                _Position(self.source, e.lineno, e.offset),
+            )
+        after[0] = len(name_ids)
+        first = self.starts[1]
+        if data[first] != ord("<") or data[first + 1] == 0:
+            raise ValueError(
+                "lazy=True only supports ASCII compatible encodings, such as UTF-8"
+            )
+
+    def children(self, position):
+        """
+        Positions of the children of the element at ``position``
+        """
+        after = self.after
+        children = []
+        child = position + 1
+        while child < after[position]:
+            children.append(child)
+            child = after[child]
+        return children
+
+    def _extent(self, position):
+        # start of the start tag, end of the start tag, and end of the element
+        start = self.starts[position]
+        match = _START_TAG.match(self.data, start)
+        if match.group(1):
+            return start, match.end(), match.end()
+        return start, match.end(), _END_TAG.match(self.data, self.ends[position]).end()
+
+    def _parser(self):
+        parser = _create_expat_parser(self.encoding)
+        parser.buffer_text = True
+        return parser
+
+    def attributes(self, position):
+        """
+        Attributes of the element at ``position``, read from its start tag
+        """
+        if not position:
+            return None
+        start, tag_end, end = self._extent(position)
+        attributes = []
+        parser = self._parser()
+        parser.ordered_attributes = True
+        parser.StartElementHandler = lambda name, attrs: attributes.extend(attrs)
+        with self.data[start:tag_end] as tag:
+            if end == tag_end:
+                parser.Parse(tag, True)
+            else:
+                # made into an empty element tag
+                parser.Parse(tag[:-1], False)
+                parser.Parse(b"/>", True)
+        if not attributes:
+            return NO_ATTRIBUTES
+        keys = tuple(attributes[::2])
+        index = self._attribute_indexes.get(keys)
+        if index is None:
+            index = self._attribute_indexes[keys] = {
+                key: i for i, key in enumerate(keys)
+            }
+        return Attributes(index, tuple(attributes[1::2]))
+
+    def cdata(self, position):
+        """
+        Text of the element at ``position``, read from the element with the
+        ranges of its children left out
+        """
+        if not position:
+            return ""
+        parts = []
+        parser = self._parser()
+        parser.CharacterDataHandler = parts.append
+        start, _, end = self._extent(position)
+        for child in self.children(position):
+            with self.data[start : self.starts[child]] as part:
+                parser.Parse(part, False)
+            start = self._extent(child)[2]
+        with self.data[start:end] as part:
+            parser.Parse(part, True)
+        return "".join(parts)
+
+
+ParseCacheInfo = collections.namedtuple(
+    "ParseCacheInfo", ["hits", "misses", "evictions", "entries", "size", "max_size"]
+)
+
+
+class ParseCache(object):
+    """
+    Cache of parsed documents for ``parse(..., cache=cache)``, so that
+    documents which are parsed again are not run through the parser.
+
+    Files are looked up by path, modification time and size, XML strings
+    and bytes-like objects by a hash of their content, together with the
+    options they are parsed with. URLs and file-like objects are never
+    cached.
+
+    When the estimated size of the cached trees exceeds ``max_size`` bytes,
+    the least recently used ones are evicted. By default every lookup
+    returns a new copy of the cached tree, which is cheaper than parsing
+    and may be modified freely. With ``copy=False`` the same tree is
+    returned to every caller instead, which is faster still but must then
+    be treated as read-only.
+
+    A single cache may be shared between threads and parsers.
+    """
+
+    # rough number of bytes taken by an element, its lists and attributes
+    ELEMENT_SIZE = 200
+
+    def __init__(self, max_size=2**26, copy=True):
+        self.max_size = max_size
+        self.copy = copy
+        self.hits = self.misses = self.evictions = self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def info(self):
+        """
+        Returns a ``ParseCacheInfo`` named tuple with the number of hits,
+        misses and evictions so far, and the number and estimated size of
+        the cached trees.
+        """
+        with self._lock:
+            return ParseCacheInfo(
+                self.hits,
+                self.misses,
+                self.evictions,
+                len(self._entries),
+                self.size,
+                self.max_size,
+            )
+
+    def clear(self):
+        """
+        Removes all cached trees, but keeps the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    @staticmethod
+    def key(filename):
+        """
+        The content key of ``filename``, or ``None`` if it is not cacheable.
+        """
+        if is_bytes(filename):
+            return ("bytes", hashlib.blake2b(filename).digest())
+        if not is_string(filename) or is_url(filename):
+            return None
+        if os.path.exists(filename):
+            stat = os.stat(filename)
+            return ("file", os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+        data = filename.encode("utf-8", "surrogatepass")
+        return ("str", hashlib.blake2b(data).digest())
+
+    def get(self, key):
+        """
+        The tree cached under ``key``, or ``None``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+        if not self.copy:
+            return entry[0]
+        element_class, is_root, flat = entry[0], entry[1], entry[2]
+        with _gc_paused():
+            return _unflatten(element_class, is_root, *flat)
+
+    def put(self, key, root):
+        """
+        Caches ``root`` under ``key``, evicting the least recently used
+        trees if necessary.
+        """
+        flat = _flatten(root)
+        names, attributes, cdatas = flat[:3]
+        size = self.ELEMENT_SIZE * len(names) + sum(map(len, cdatas))
+        size += sum(len(value) for a in attributes if a for value in a.values())
+        if size > self.max_size:
+            return
+        if self.copy:
+            entry = (type(root), root.is_root, flat, size)
+        else:
+            entry = (root, None, None, size)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[3]
+            self._entries[key] = entry
+            self.size += size
+            while self.size > self.max_size:
+                self.size -= self._entries.popitem(last=False)[1][3]
+                self.evictions += 1
+
+
+class Parser(object):
+    """
+    Reusable parser for many documents.
+
+    Takes the same options and parser features as ``parse()``. They are
+    applied once and the configured SAX readers are kept ready, one pool
+    per thread, so repeatedly parsing small documents skips the reader
+    setup. A single ``Parser`` may be shared between threads.
+
+    Raises ``AttributeError`` if a requested xml.sax feature is not found in
+    ``xml.sax.handler``, and ``ValueError`` if both ``cache`` and
+    ``indexes`` are given, ``lazy`` or ``schema`` is combined with an
+    option it doesn't support or ``backend`` is unknown. Raises
+    ``TypeError`` if ``schema`` is not a dataclass.
+    """
+
+    def __init__(
+        self,
+        compact=False,
+        mmap=False,
+        include=None,
+        exclude=None,
+        strip_whitespace=False,
+        indexes=(),
+        cache=None,
+        max_depth=None,
+        backend=None,
+        lazy=False,
+        schema=None,
+        **parser_features,
+    ):
+        if cache is not None and indexes:
+            raise ValueError("indexes cannot be filled from a cache")
+        if lazy and (
+            compact
+            or include
+            or exclude
+            or strip_whitespace
+            or indexes
+            or cache is not None
+        ):
+            raise ValueError("lazy=True only supports the mmap and max_depth options")
+        if schema is not None and (
+            lazy or compact or include or exclude or indexes or cache is not None
+        ):
+            raise ValueError(
+                "schema only supports the mmap, strip_whitespace, max_depth and "
+                "backend options"
+            )
+        if schema is not None:
+            # compiled up front, so that invalid schemas fail right away
+            _schema_plan(schema)
+        self.schema = schema
+        backend = backend or DEFAULT_BACKEND
+        if backend not in _READERS:
+            raise ValueError("backend must be 'sax', 'expat' or 'lxml'")
+        if backend == "lxml" and lxml is None:
+            backend = "expat"
+        self.backend = backend
+        self.element_class = CompactElement if compact else Element
+        self.mmap = mmap
+        self.handler_options = {
+            "path_filter": PathFilter(include, exclude) if include or exclude else None,
+            "strip_whitespace": strip_whitespace,
+            "indexes": indexes,
+            "max_depth": max_depth,
+        }
+        self.features = [
+            (getattr(xml.sax.handler, feature), value)
+            for feature, value in parser_features.items()
+        ]
+        self.cache = cache
+        # everything besides the source which the parsed tree depends on
+        self.lazy = lazy
+        if lazy:
+            # always parsed with pyexpat, so the features must suit it
+            reader = ExpatReader()
+            for feature, value in self.features:
+                reader.setFeature(feature, value)
+        self._cache_key = (
+            compact,
+            tuple(include or ()),
+            tuple(exclude or ()),
+            strip_whitespace,
+            max_depth,
+            tuple(sorted(parser_features.items())),
+        )
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # reader pools are per process
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _acquire_reader(self, sax_handler):
+        readers = getattr(self._local, "readers", None)
+        if readers:
+            reader = readers.pop()
+        else:
+            reader = _READERS[self.backend]()
+            for feature, value in self.features:
+                reader.setFeature(feature, value)
+        reader.setContentHandler(sax_handler)
+        # reader.parse() sets the locator, feeding the reader does not
+        if isinstance(reader, LxmlReader):
+            locator = reader
+        else:
+            locator = xml.sax.expatreader.ExpatLocator(reader)
+        sax_handler.setDocumentLocator(locator)
+        return reader
+
+    def _release_reader(self, reader):
+        # don't keep the last document alive through the reader
+        reader.setContentHandler(_NULL_HANDLER)
+        readers = getattr(self._local, "readers", None)
+        if readers is None:
+            readers = self._local.readers = []
+        readers.append(reader)
+
+    def _make_handler(self, handler_class, *args):
+        if self.lazy:
+            raise ValueError("lazy=True is only supported by parse()")
+        if self.schema is not None:
+            raise ValueError("schema is only supported by parse() and iterparse()")
+        return handler_class(
+            *args, element_class=self.element_class, **self.handler_options
+        )
+
+    def _make_schema_handler(self, tag=None):
+        return SchemaHandler(
+            self.schema,
+            tag,
+            strip_whitespace=self.handler_options["strip_whitespace"],
+            max_depth=self.handler_options["max_depth"],
+        )
+
+    def parse(self, filename):
+        """
+        Parses a filename, URL, XML data string, bytes-like object or
+        file-like object and returns its root element, see ``untangle.parse()``.
+        """
+        _check_source(filename, "parse")
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(filename)
+            if key is not None:
+                key += self._cache_key
+                root = self.cache.get(key)
+                if root is not None:
+                    return root
+        if self.lazy:
+            return _parse_lazy(filename, self.mmap, self.handler_options["max_depth"])
+        if self.schema is not None:
+            sax_handler = self._make_schema_handler()
+        else:
+            sax_handler = self._make_handler(Handler)
+        reader = self._acquire_reader(sax_handler)
+        for _ in _feed(reader, filename, self.mmap):
+            pass
+        # readers which failed half-way are dropped instead of reused
+        self._release_reader(reader)
+        if self.schema is not None:
+            return sax_handler.result
+        if key is not None:
+            self.cache.put(key, sax_handler.root)
+        return sax_handler.root
+
+    def iterparse(self, filename, tag):
+        """
+        Yields every completed element named ``tag``, see
+        ``untangle.iterparse()``.
+        """
+        _check_source(filename, "iterparse")
+        if self.schema is not None:
+            sax_handler = self._make_schema_handler(tag)
+        else:
+            sax_handler = self._make_handler(StreamHandler, tag)
+        reader = self._acquire_reader(sax_handler)
+        for _ in _feed(reader, filename, self.mmap):
+            yield from _drain(sax_handler)
+        self._release_reader(reader)
+
+    def extract_columns(self, filename, record, fields):
+        """
+        Collects the fields of every element named ``record`` into columns,
+        see ``untangle.extract_columns()``.
+        """
+        _check_source(filename, "extract_columns")
+        sax_handler = ColumnHandler(
+            record, fields, max_depth=self.handler_options["max_depth"]
+        )
+        reader = self._acquire_reader(sax_handler)
+        for _ in _feed(reader, filename, self.mmap):
+            pass
+        self._release_reader(reader)
+        return sax_handler.columns
+
+
+class PushParser(object):
+    """
+    Incremental parser for documents which arrive in pieces, e.g. over a
+    network connection.
+
+    Data is passed in with ``feed()`` as soon as it is available and the
+    document is finished with ``close()``, which returns the same structure
+    as ``parse()``. Callbacks registered with ``on()`` are called with every
+    completed element of the given name while the document is still being
+    fed.
+
+    Takes the same options and parser features as ``parse()``, except for
+    ``mmap``.
+    """
+
+    def __init__(self, **options):
+        parser = Parser(**options)
+        self.handler = parser._make_handler(PushHandler)
+        self._reader = parser._acquire_reader(self.handler)
+
+    @property
+    def root(self):
+        """
+        The document built so far
+        """
+        return self.handler.root
+
+    def on(self, tag, callback):
+        """
+        Calls ``callback(element)`` whenever an element named ``tag`` is
+        complete. ``tag`` is matched against both the raw and the sanitized
+        element name.
+        """
+        self.handler.callbacks.setdefault(tag, []).append(callback)
+
+    def feed(self, data):
+        """
+        Parses the next piece of the document, given as string or bytes-like
+        object.
+
+        Raises ``xml.sax.SAXParseException`` if the document is invalid.
+        """
+        if self._reader is None:
+            raise ValueError("feed() called after close()")
+        self._reader.feed(data)
+
+    def close(self):
+        """
+        Finishes the document and returns its root element.
+
+        Raises ``xml.sax.SAXParseException`` if the document is incomplete.
+        """
+        if self._reader is not None:
+            reader, self._reader = self._reader, None
+            reader.close()
+        return self.handler.root
+
+
+def parse(filename, **options):
+    """
+    Interprets the given string as a filename, URL or XML data string,
+    parses it and returns a Python object which represents the given
+    document. File-like objects and XML data in ``bytes``, ``bytearray``,
+    ``memoryview`` or ``mmap`` objects are accepted as well; the latter are
+    fed to the parser without copying and decoded according to the XML
+    declaration.
+
+    The following options are supported:
+
+    ``compact=True``
+        builds the document out of ``CompactElement`` objects, which need
+        considerably less memory than ``Element``.
+
+    ``mmap=True``
+        memory-maps ``filename`` if it names a file and feeds it to the
+        parser in large slices instead of reading it through small buffers.
+
+    ``include=[...]``, ``exclude=[...]``
+        lists of element paths, such as ``"Envelope/Body/Result/*"``, which
+        select the parts of the document to build; everything else is
+        skipped while parsing, see ``PathFilter``.
+
+    ``strip_whitespace=True``
+        strips leading and trailing whitespace from cdata. Whitespace-only
+        text, such as the indentation of pretty-printed documents, is never
+        stored.
+
+    ``indexes=[...]``
+        ``AttributeIndex`` objects which are filled with the matching
+        elements while the document is built, saving a second pass over
+        the tree. A ``Parser`` adds the elements of every document it
+        parses to the same indexes.
+
+    ``max_depth=n``
+        raises ``xml.sax.SAXParseException`` as soon as an element is
+        nested more than ``n`` levels deep, so that pathological documents
+        fail quickly instead of using up memory.
+
+    ``backend="expat"``
+        feeds the document to pyexpat directly instead of through the
+        ``xml.sax`` layer, which is faster but only supports the
+        ``feature_external_ges`` and ``feature_string_interning`` parser
+        features, see ``ExpatReader``.
+
+    ``backend="lxml"``
+        parses with lxml if it is installed, see ``LxmlReader``, and
+        falls back to ``backend="expat"`` otherwise. It is slower than
+        ``backend="expat"``, and meant for documents which should be
+        parsed by libxml2.
+
+    ``lazy=True``
+        only indexes where each element is in the document while parsing,
+        and builds elements, attributes and cdata when they are first
+        accessed, see ``LazyElement``. This makes parsing a lot cheaper if
+        only a few elements are used. The whole document is kept in
+        memory, or memory-mapped with ``mmap=True``, as long as the tree
+        is in use. Apart from ``mmap``, only ``max_depth`` and the parser
+        features of ``backend="expat"`` can be combined with it, and it
+        can't be used with ``iterparse()`` and ``PushParser``.
+
+    ``schema=SomeDataclass``
+        binds the document element to an instance of the dataclass while
+        parsing and returns that instead of building elements, see
+        ``SchemaHandler``. With ``iterparse()``, every element named
+        ``tag`` is bound and yielded. Only ``mmap``, ``strip_whitespace``,
+        ``max_depth`` and ``backend`` can be combined with it.
+
+    ``cache=ParseCache(...)``
+        looks the document up in a ``ParseCache`` first, and caches it
+        after parsing otherwise.
+
+    Extra arguments to this function are treated as feature values that are
+    passed to ``parser.setFeature()``. For example, ``feature_external_ges=False``
+    will set ``xml.sax.handler.feature_external_ges`` to False, disabling
+    the parser's inclusion of external general (text) entities such as DTDs.
+
+    Use a ``Parser`` instead when parsing many documents with the same
+    settings.
+
+    Raises ``ValueError`` if the first argument is None / empty string.
+
+    Raises ``AttributeError`` if a requested xml.sax feature is not found in
+    ``xml.sax.handler``.
+
+    Raises ``xml.sax.SAXParseException`` if something goes wrong
+    during parsing.
+
+    Raises ``defusedxml.common.EntitiesForbidden``
+    or ``defusedxml.common.ExternalReferenceForbidden``
+    when a potentially malicious entity load is attempted. See also
+    https://github.com/tiran/defusedxml#attack-vectors
+    """
+    return Parser(**options).parse(filename)
+
+
+def iterparse(filename, tag, **options):
+    """
+    Parses the given filename, URL, XML data string, bytes-like object or
+    file-like object incrementally and yields every element named ``tag``
+    as soon as its end tag has been read.
+
+    Yielded elements are detached from their parent, and elements which are
+    not inside a ``tag`` element are discarded, so memory usage depends on
+    the size of a single record rather than on the whole document. ``tag``
+    is matched against both the raw and the sanitized element name.
+
+    Accepts the same options and parser features and raises the same
+    exceptions as ``parse()``.
+    """
+    return Parser(**options).iterparse(filename, tag)
+
+
+def extract_columns(filename, record, fields, **options):
+    """
+    Parses the given filename, URL, XML data string, bytes-like object or
+    file-like object and collects the fields of every element named
+    ``record`` into columns, without building any elements. Returns a
+    dictionary which maps the names in ``fields`` to lists, or arrays,
+    with one value per record: ::
+
+        columns = untangle.extract_columns(
+            "feed.xml", "row", {"id": ("@id", "q"), "price": ("price", "d")}
+        )
+
+    ``fields`` maps each column name to a path relative to the record,
+    which consists of child element names separated by ``/``, optionally
+    followed by ``@attribute``. A path without attribute selects the text
+    of the element, and ``"."`` the text of the record itself. Raw and
+    sanitized names are both accepted, and the first match in a record is
+    used. Instead of a path, a tuple of ``(path, type)`` or ``(path, type,
+    default)`` may be given:
+
+    * a ``type`` which is an integer or floating point typecode of the
+      ``array`` module, such as ``"q"`` or ``"d"``, converts the values and
+      collects them in an ``array.array``.
+    * a callable ``type`` is called with each value, and the results are
+      collected in a list.
+
+    Records without a value for a field get ``default``, which is ``None``
+    for columns of strings and of callables. Typed arrays have no default
+    unless one is given.
+
+    Accepts the same options and parser features as ``parse()``, of which
+    ``mmap``, ``max_depth`` and ``backend`` have an effect.
+
+    Raises ``ValueError`` if a field is invalid, and if a value is missing
+    and has no default or can't be converted. Raises the same exceptions as
+    ``parse()`` otherwise.
+    """
+    return Parser(**options).extract_columns(filename, record, fields)
+
+
+def parse_many(sources, workers=None, executor="process", ordered=True, **options):
+    """
+    Parses many documents in parallel and returns an iterator over their
+    root elements, in the order of ``sources``.
+
+    With ``executor="process"`` (the default) the documents are parsed in a
+    pool of ``workers`` processes, which sidesteps the GIL; the sources must
+    then be picklable, e.g. filenames, URLs, XML strings or bytes. Parsed
+    trees are sent back in a compact, flat pickle format. With
+    ``executor="thread"`` a thread pool is used instead, which is cheaper
+    to start and can parse file-like objects, but only helps when parsing
+    waits on I/O. ``workers`` defaults to the number of CPUs.
+
+    If ``ordered`` is false, ``(source, root)`` pairs are yielded as soon
+    as each document is done.
+
+    Accepts the same options and parser features as ``parse()``, except
+    that ``cache`` and ``indexes`` would only be filled in the worker
+    processes, and raise ``ValueError`` with ``executor="process"``.
+    Exceptions raised while parsing a document are raised when its result
+    is reached.
+    """
+    workers = workers or os.cpu_count() or 1
+    if executor == "process":
+        if options.get("cache") is not None or options.get("indexes"):
+            raise ValueError("cache and indexes need executor='thread'")
+        pool = concurrent.futures.ProcessPoolExecutor(workers)
+    elif executor == "thread":
+        pool = concurrent.futures.ThreadPoolExecutor(workers)
+    else:
+        raise ValueError("executor must be 'process' or 'thread'")
+    return _parse_many(pool, workers, sources, ordered, Parser(**options))
+
+
+def _parse_many(pool, workers, sources, ordered, parser):
+    parse = parser.parse
+    if isinstance(pool, concurrent.futures.ProcessPoolExecutor):
+        parse = functools.partial(_parse_in_process, parser)
+    with pool:
+        try:
+            if ordered:
+                chunksize = 1
+                if isinstance(pool, concurrent.futures.ProcessPoolExecutor):
+                    # batches documents to save on inter-process round trips
+                    sources = list(sources)
+                    chunksize = max(1, len(sources) // (workers * 4))
+                yield from pool.map(parse, sources, chunksize=chunksize)
+            else:
+                futures = {pool.submit(parse, source): source for source in sources}
+                for future in concurrent.futures.as_completed(futures):
+                    yield futures[future], future.result()
+        except _RemoteError as e:
+            raise e.rebuild() from None
+
+
+def _parse_in_process(parser, source):
+    """
+    Parses ``source`` in a worker process of ``parse_many()``, raising
+    exceptions as ``_RemoteError``.
+    """
+    try:
+        return parser.parse(source)
+    except Exception as e:
+        raise _RemoteError.wrap(e) from None
+
+
+class _RemoteError(Exception):
+    """
+    Picklable stand-in for an exception raised in a worker process.
+
+    SAX exceptions keep a locator, and ``defusedxml``'s exceptions take
+    arguments they don't pass on, so neither survives pickling. This keeps
+    their type, message, system id, line and column, and the attributes
+    of other exceptions, and ``rebuild()`` turns them back into an
+    exception of the original type.
+    """
+
+    @classmethod
+    def wrap(cls, e):
+        if isinstance(e, xml.sax.SAXParseException):
+            position = (e.getSystemId(), e.getLineNumber(), e.getColumnNumber())
+            return cls(type(e), e.getMessage(), position, None)
+        state = dict(vars(e))
+        try:
+            pickle.dumps(state)
+        except Exception:
+            state = None
+        return cls(type(e), str(e), None, state)
+
+    def rebuild(self):
+        error_type, message, position, state = self.args
+        if position is not None:
+            system_id, line, column = position
+            source = xml.sax.xmlreader.InputSource(system_id)
+            return error_type(message, None, _Position(source, line, column))
+        error = error_type.__new__(error_type)
+        error.args = (message,)
+        if state:
+            error.__dict__.update(state)
+        return error
+
+
+async def parse_async(reader, **options):
+    """
+    Reads a document from an asynchronous byte source, parses it and
+    returns a Python object which represents it, like ``parse()``.
+
+    ``reader`` is anything with an ``async read(n)`` method, such as an
+    ``asyncio.StreamReader`` or an aiohttp response's ``content``, or an
+    async iterable of byte chunks. Control is handed back to the event
+    loop after every parsed chunk of at most ``BUFFER_SIZE`` bytes, so a
+    large document does not block other tasks.
+
+    Accepts the same options and parser features and raises the same
+    exceptions as ``parse()``, except for ``mmap``.
+    """
+    parser = PushParser(**options)
+    empty = True
+    async for chunk in _read_async(reader):
+        empty = False
+        parser.feed(chunk)
+        await asyncio.sleep(0)
+    if empty:
+        raise ValueError("parse_async() got an empty document")
+    return parser.close()
+
+
+async def iterparse_async(reader, tag, **options):
+    """
+    Asynchronous counterpart of ``iterparse()`` for use with ``async for``.
+    Reads from the same sources as ``parse_async()``.
+    """
+    parser = Parser(**options)
+    sax_handler = parser._make_handler(StreamHandler, tag)
+    sax_reader = parser._acquire_reader(sax_handler)
+    empty = True
+    async for chunk in _read_async(reader):
+        empty = False
+        sax_reader.feed(chunk)
+        for element in _drain(sax_handler):
+            yield element
+        await asyncio.sleep(0)
+    if empty:
+        raise ValueError("iterparse_async() got an empty document")
+    sax_reader.close()
+    for element in _drain(sax_handler):
+        yield element
+
+
+async def _read_async(reader):
+    """
+    Yields the data of an asynchronous byte source in chunks of at most
+    ``BUFFER_SIZE`` bytes.
+    """
+    if hasattr(reader, "read"):
+        while True:
+            data = await reader.read(BUFFER_SIZE)
+            if not data:
+                break
+            yield data
+    else:
+        async for data in reader:
+            if len(data) <= BUFFER_SIZE:
+                yield data
+                continue
+            with memoryview(data) as view:
+                for start in range(0, len(view), BUFFER_SIZE):
+                    yield view[start : start + BUFFER_SIZE]
+
+
+def dump(element, file):
+    """
+    Writes ``element`` and all its descendants to ``file``, a filename or
+    binary file object, as a compact binary snapshot which ``load()`` reads
+    back much faster than the XML document can be parsed.
+
+    Names and text are stored once in a string table, and the structure as
+    flat arrays of indexes into it.
+
+    Raises ``ValueError`` if a name, attribute or cdata contains a NUL
+    character, which cannot occur in parsed XML documents.
+    """
+    strings = {"": 0}
+    layouts = {(): 0}
+    names, cdatas, sizes, element_layouts, values = (array.array("i") for _ in range(5))
+    stack = [element]
+    while stack:
+        node = stack.pop()
+        name = node._name
+        names.append(-1 if name is None else strings.setdefault(name, len(strings)))
+        cdatas.append(strings.setdefault(node.cdata, len(strings)))
+        sizes.append(len(node.children))
+        attributes = node._attributes
+        if attributes is None:
+            element_layouts.append(-1)
+        else:
+            element_layouts.append(layouts.setdefault(tuple(attributes), len(layouts)))
+            values.extend(
+                [strings.setdefault(v, len(strings)) for v in attributes.values()]
+            )
+        stack.extend(reversed(node.children))
+    layout_sizes, layout_keys = array.array("i"), array.array("i")
+    for keys in layouts:
+        layout_sizes.append(len(keys))
+        layout_keys.extend([strings.setdefault(k, len(strings)) for k in keys])
+
+    text = "\0".join(strings)
+    if text.count("\0") != len(strings) - 1:
+        raise ValueError("dump() cannot store text containing NUL characters")
+    text = text.encode("utf-8")
+    flags = _SNAPSHOT_IS_ROOT if element.is_root else 0
+    if not isinstance(element, Element):
+        flags |= _SNAPSHOT_COMPACT
+    sections = (
+        names,
+        cdatas,
+        sizes,
+        element_layouts,
+        layout_sizes,
+        layout_keys,
+        values,
+    )
+    if sys.byteorder != "little":
+        for section in sections:
+            section.byteswap()
+    header = _SNAPSHOT_HEADER.pack(
+        _SNAPSHOT_MAGIC,
+        _SNAPSHOT_VERSION,
+        flags,
+        len(names),
+        len(layouts),
+        len(layout_keys),
+        len(values),
+        len(text),
+    )
+
+    def write(f):
+        f.write(header)
+        for section in sections:
+            section.tofile(f)
+        f.write(text)
+
+    if hasattr(file, "write"):
+        write(file)
+    else:
+        with open(file, "wb") as f:
+            write(f)
+
+
+def load(file, mmap=False):
+    """
+    Reads a snapshot written by ``dump()`` from ``file``, a filename or
+    binary file object, and returns the element it was made of.
+
+    With ``mmap=True`` a file is memory-mapped and its arrays are read in
+    place instead of being copied into memory first.
+
+    Raises ``ValueError`` if ``file`` is not a snapshot of this version.
+    """
+    if hasattr(file, "read"):
+        return _load_snapshot(memoryview(file.read()))
+    return _load_file(file, mmap)
+
+
+def _load_file(filename, use_mmap):
+    with open(filename, "rb") as f:
+        if not use_mmap or not os.path.getsize(filename):
+            return _load_snapshot(memoryview(f.read()))
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            with memoryview(data) as view:
+                return _load_snapshot(view)
+
+
+def _load_snapshot(data):
+    with _gc_paused():
+        return _build_snapshot(data)
+
+
+def _build_snapshot(data):
+    if len(data) < _SNAPSHOT_HEADER.size:
+        raise ValueError("not an untangle snapshot")
+    magic, version, flags, count, layout_count, key_count, value_count, size = (
+        _SNAPSHOT_HEADER.unpack_from(data)
+    )
+    if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION:
+        raise ValueError("not an untangle snapshot")
+    offset = _SNAPSHOT_HEADER.size
+    sections = []
+    for length in (count, count, count, count, layout_count, key_count, value_count):
+        sections.append(_read_ints(data, offset, length))
+        offset += 4 * length
+    name_ids, cdata_ids, sizes, element_layouts, layout_sizes, key_ids, value_ids = (
+        sections
+    )
+    with data[offset : offset + size] as text:
+        if len(text) != size:
+            raise ValueError("truncated untangle snapshot")
+        strings = str(text, "utf-8").split("\0")
+    # index -1 stands for None
+    strings.append(None)
+    for i in set(name_ids).union(key_ids):
+        if strings[i] is not None:
+            strings[i] = sys.intern(strings[i])
+
+    layouts = []
+    start = 0
+    for length in layout_sizes:
+        keys = key_ids[start : start + length]
+        layouts.append({strings[k]: i for i, k in enumerate(keys)})
+        start += length
+    attributes = []
+    values = [strings[i] for i in value_ids]
+    start = 0
+    for layout in element_layouts:
+        if layout < 0:
+            attributes.append(None)
+        elif layout:
+            index = layouts[layout]
+            end = start + len(index)
+            attributes.append(Attributes(index, tuple(values[start:end])))
+            start = end
+        else:
+            attributes.append(NO_ATTRIBUTES)
+    element_class = CompactElement if flags & _SNAPSHOT_COMPACT else Element
+    return _unflatten(
+        element_class,
+        bool(flags & _SNAPSHOT_IS_ROOT),
+        [strings[i] for i in name_ids],
+        attributes,
+        [strings[i] for i in cdata_ids],
+        sizes,
+    )
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # trees have no reference cycles, so collecting while one is being
+    # built only costs time
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _read_ints(data, offset, length):
+    with data[offset : offset + 4 * length] as view:
+        if len(view) != 4 * length:
+            raise ValueError("truncated untangle snapshot")
+        if sys.byteorder == "little":
+            with view.cast("i") as ints:
+                return ints.tolist()
+        ints = array.array("i", view.tobytes())
+        ints.byteswap()
+        return ints.tolist()
+
+
+def _check_source(filename, caller):
+    if (
+        filename is None
+        or (is_string(filename) and filename.strip()) == ""
+        or (is_bytes(filename) and not len(filename))
+    ):
+        raise ValueError("%s() takes a filename, URL or XML string" % caller)
+
+
+def _feed(reader, filename, use_mmap=False):
+    """
+    Feeds ``filename`` to ``reader`` chunk by chunk and yields after every
+    chunk. This is what ``reader.parse()`` does, without resetting the
+    reader twice per document. Bytes-like objects, and files if
+    ``use_mmap`` is set, are fed as zero-copy slices.
+    """
+    if is_bytes(filename):
+        yield from _feed_bytes(reader, filename, BUFFER_SIZE)
+        return
+    if (
+        use_mmap
+        and is_string(filename)
+        and os.path.isfile(filename)
+        and os.path.getsize(filename)
+    ):
+        with open(filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from _feed_bytes(reader, data, MMAP_CHUNK_SIZE, filename)
+        return
+
+    source = input_source(filename)
+    # lets the reader report the system id in errors and honour the
+    # source's encoding, like reader.parse() would
+    reader._source = source
+    stream = source.getCharacterStream() or source.getByteStream()
+    try:
+        buffer = stream.read(BUFFER_SIZE)
+        while buffer:
+            reader.feed(buffer)
+            yield
+            buffer = stream.read(BUFFER_SIZE)
+        reader.close()
+        yield
+    finally:
+        stream.close()
+
+
+def _feed_bytes(reader, data, chunk_size, system_id=None):
+    reader._source = xml.sax.xmlreader.InputSource(system_id)
+    with memoryview(data) as view, view.cast("B") as buffer:
+        for start in range(0, len(buffer), chunk_size):
+            # released right away, so that tracebacks referencing the
+            # chunk don't keep e.g. an mmap from being closed
+            with buffer[start : start + chunk_size] as chunk:
+                reader.feed(chunk)
+            yield
+    reader.close()
+    yield
+
+
+def _parse_lazy(filename, use_mmap, max_depth):
+    """
+    Indexes ``filename`` and returns the root element of the lazily built
+    document, see ``_LazyDocument``. The document is kept in memory, or
+    mapped if ``use_mmap`` is set, as long as any of its elements is alive.
+    """
+    encoding = None
+    system_id = None
+    if is_bytes(filename):
+        data = filename
+    elif (
+        use_mmap
+        and is_string(filename)
+        and os.path.isfile(filename)
+        and os.path.getsize(filename)
+    ):
+        with open(filename, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        system_id = filename
+    else:
+        source = input_source(filename)
+        system_id = source.getSystemId()
+        encoding = source.getEncoding()
+        stream = source.getCharacterStream() or source.getByteStream()
+        with stream:
+            data = stream.read()
+        if is_string(data):
+            data = data.encode("utf-8")
+            encoding = "utf-8"
+    return LazyElement(_LazyDocument(data, encoding, system_id, max_depth), 0)
+
+
+def _drain(sax_handler):
+    completed = sax_handler.completed
+    sax_handler.completed = []
+    return completed
+
+
+def input_source(filename):
+    """
+    Wraps a filename, URL, XML data string or file-like object into an
+    ``xml.sax.xmlreader.InputSource``.
+    """
+    if is_string(filename) and (os.path.exists(filename) or is_url(filename)):
+        return xml.sax.saxutils.prepare_input_source(filename)
+    if hasattr(filename, "read"):
+        return xml.sax.saxutils.prepare_input_source(filename)
+    return xml.sax.saxutils.prepare_input_source(StringIO(filename))
 
 
 def is_url(string):
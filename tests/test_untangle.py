@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import array
+import asyncio
+import dataclasses
+import os
+import pickle
 import unittest
 import untangle
 import xml.sax
@@ -8,6 +13,11 @@ from xml.sax.xmlreader import AttributesImpl
 
 import defusedxml
 
+# runs the whole suite against another backend, e.g. UNTANGLE_BACKEND=expat
+untangle.DEFAULT_BACKEND = os.environ.get("UNTANGLE_BACKEND", "sax")
+# backend for documents nested deeper than libxml2's limit of 256 levels
+DEEP_BACKEND = "expat" if untangle.DEFAULT_BACKEND == "lxml" else None
+
 
 class FromStringTestCase(unittest.TestCase):
     """Basic parsing tests with input as string"""
@@ -428,6 +438,23 @@ class ElementNameSanitizationTestCase(unittest.TestCase):
         children = o.root.foo_bar
         self.assertEqual(2, len(children))
 
+    def test_sanitize_name(self):
+        """Test the cached name sanitizer"""
+        self.assertEqual("foo_bar_baz_qux", untangle.sanitize_name("foo-bar:baz.qux"))
+        self.assertEqual("class_", untangle.sanitize_name("class"))
+        self.assertIs(untangle.sanitize_name("a-b"), untangle.sanitize_name("a-b"))
+
+    def test_names_are_shared(self):
+        """Test that elements with the same tag share one name object"""
+        o = untangle.parse("<root><x-y/><x-y/></root>")
+        self.assertIs(o.root.x_y[0]._name, o.root.x_y[1]._name)
+
+    def test_name_cache_is_bounded(self):
+        """Test that the name cache does not grow without limit"""
+        for i in range(untangle.NAME_CACHE_SIZE + 10):
+            untangle.sanitize_name("tag-%d" % i)
+        self.assertLessEqual(len(untangle._NAME_CACHE), untangle.NAME_CACHE_SIZE)
+
 
 class CDataHandlingTestCase(unittest.TestCase):
     """Test CDATA handling edge cases"""
@@ -452,6 +479,59 @@ class CDataHandlingTestCase(unittest.TestCase):
         o = untangle.parse("<root>Before<child/>After</root>")
         self.assertEqual("BeforeAfter", o.root.cdata)
 
+    def test_chunked_cdata(self):
+        """Test text delivered in many characters() calls"""
+        o = untangle.parse("<root>%s</root>" % ("line &amp; more\n" * 1000))
+        self.assertEqual("line & more\n" * 1000, o.root.cdata)
+        self.assertIsInstance(o.root.cdata, str)
+
+    def test_add_cdata_after_read(self):
+        """Test that cdata stays consistent when read between chunks"""
+        e = untangle.Element("a", {})
+        e.add_cdata("foo")
+        e.add_cdata("bar")
+        self.assertEqual("foobar", e.cdata)
+        e.add_cdata("baz")
+        self.assertEqual("foobarbaz", e.cdata)
+        e.cdata = "reset"
+        self.assertEqual("reset", e.cdata)
+
+
+class WhitespaceTestCase(unittest.TestCase):
+    """Tests the strip_whitespace option"""
+
+    xml = """<root>
+    <item>
+        <name>  Widget </name>
+        <note>first
+second</note>
+        <empty>   </empty>
+    </item>
+    <mixed> one <b/> two
+    </mixed>
+</root>"""
+
+    def test_strip_whitespace(self):
+        o = untangle.parse(self.xml, strip_whitespace=True)
+        self.assertEqual("", o.root.cdata)
+        self.assertEqual("", o.root.item.cdata)
+        self.assertEqual("Widget", o.root.item.name.cdata)
+        self.assertEqual("first\nsecond", o.root.item.note.cdata)
+        self.assertEqual("", o.root.item.empty.cdata)
+        self.assertEqual("one  two", o.root.mixed.cdata)
+
+    def test_whitespace_not_stored(self):
+        o = untangle.parse(self.xml, strip_whitespace=True)
+        self.assertIsNone(o.root._cdata_parts)
+        self.assertEqual("", o.root._cdata)
+
+    def test_other_entry_points(self):
+        items = untangle.iterparse(self.xml, tag="item", strip_whitespace=True)
+        self.assertEqual(["Widget"], [i.name.cdata for i in items])
+        parser = untangle.PushParser(strip_whitespace=True)
+        parser.feed(self.xml)
+        self.assertEqual("Widget", parser.close().root.item.name.cdata)
+
 
 class LargeXmlTestCase(unittest.TestCase):
     """Test performance with large XML documents"""
@@ -622,6 +702,1315 @@ class AttributeHandlingTestCase(unittest.TestCase):
         self.assertIsNone(o.root["missing"])
         self.assertIsNone(o.root.get_attribute("missing"))
 
+    def test_attributes_mapping(self):
+        """Test the mapping holding an element's attributes"""
+        o = untangle.parse('<root><a x="1" y="2"/><a x="3" y="4"/><b/></root>')
+        first, second = o.root.a
+        self.assertEqual({"x": "1", "y": "2"}, dict(first._attributes))
+        self.assertEqual([("x", "3"), ("y", "4")], list(second._attributes.items()))
+        self.assertEqual(2, len(first._attributes))
+        self.assertIn("y", first._attributes)
+        self.assertEqual(0, len(o.root.b._attributes))
+        self.assertEqual("{'x': '1', 'y': '2'}", repr(first._attributes))
+        self.assertIs(first._attributes._index, second._attributes._index)
+
+    def test_attributes_pickle(self):
+        """Test pickling elements with attributes"""
+        o = pickle.loads(pickle.dumps(untangle.parse('<root a="1"><b c="2"/></root>')))
+        self.assertEqual("1", o.root["a"])
+        self.assertEqual("2", o.root.b["c"])
+
+
+class IterparseTestCase(unittest.TestCase):
+    """Tests streaming with iterparse()"""
+
+    feed = """<?xml version="1.0"?>
+<feed>
+    <header>ignored</header>
+    <item id="1"><name>one</name></item>
+    <item id="2"><name>two</name></item>
+    <group><item id="3"><name>three</name></item></group>
+</feed>"""
+
+    def test_yields_matching_elements(self):
+        items = list(untangle.iterparse(self.feed, tag="item"))
+        self.assertEqual(["1", "2", "3"], [i["id"] for i in items])
+        self.assertEqual("two", items[1].name.cdata)
+
+    def test_elements_are_detached(self):
+        parents = []
+        for item in untangle.iterparse(self.feed, tag="item"):
+            self.assertEqual(1, len(item.children))
+            parents.append(item)
+        self.assertEqual(3, len(parents))
+
+    def test_nested_records(self):
+        xml = '<r><item id="1"><item id="2"/><x/></item><item id="3"/></r>'
+        items = list(untangle.iterparse(xml, tag="item"))
+        self.assertEqual(["2", "1", "3"], [i["id"] for i in items])
+        self.assertEqual(2, len(items[1].children))
+        self.assertIs(items[0], items[1].item)
+        self.assertIsNotNone(items[1].x)
+
+    def test_sanitized_tag(self):
+        items = list(untangle.iterparse("<a><b-c/><b-c/></a>", tag="b_c"))
+        self.assertEqual(2, len(items))
+
+    def test_file_and_file_object(self):
+        self.assertEqual(
+            3, len(list(untangle.iterparse("tests/res/unicode.xml", tag="name")))
+        )
+        with open("tests/res/pom.xml") as pom_file:
+            versions = list(untangle.iterparse(pom_file, tag="version"))
+        self.assertEqual(["17", "0.1"], [v.cdata for v in versions])
+
+    def test_many_records(self):
+        large_xml = "<root>" + "<item>data</item>" * 10000 + "</root>"
+        count = sum(1 for _ in untangle.iterparse(large_xml, tag="item"))
+        self.assertEqual(10000, count)
+
+    def test_invalid_xml(self):
+        with self.assertRaises(xml.sax.SAXParseException):
+            list(untangle.iterparse("<a><item/>", tag="item"))
+
+    def test_empty_xml(self):
+        with self.assertRaises(ValueError):
+            list(untangle.iterparse("", tag="item"))
+
+    def test_xxe(self):
+        with self.assertRaises(defusedxml.common.EntitiesForbidden):
+            list(untangle.iterparse("tests/res/xxe.xml", tag="foo"))
+
+
+class CompactElementTestCase(unittest.TestCase):
+    """Tests parse() with compact=True"""
+
+    def setUp(self):
+        self.o = untangle.parse(
+            """
+            <root>
+             <child name="child1"><subchild name="sub1"/></child>
+             <child name="child2">text</child>
+             <other/>
+            </root>
+            """,
+            compact=True,
+        )
+
+    def test_slotted(self):
+        self.assertIsInstance(self.o.root, untangle.CompactElement)
+        self.assertFalse(hasattr(self.o.root, "__dict__"))
+        with self.assertRaises(AttributeError):
+            self.o.root.foo = "bar"
+
+    def test_access(self):
+        self.assertEqual(2, len(self.o.root.child))
+        self.assertEqual("child1", self.o.root.child[0]["name"])
+        self.assertEqual("sub1", self.o.root.child[0].subchild.get_attribute("name"))
+        self.assertEqual("text", self.o.root.child[1].cdata)
+        self.assertEqual(1, len(list(self.o.root.other)))
+        self.assertTrue(hasattr(self.o.root, "other"))
+        self.assertFalse(hasattr(self.o.root, "missing"))
+        self.assertEqual(["child", "child", "other"], dir(self.o.root))
+
+    def test_iterparse(self):
+        items = list(untangle.iterparse("<a><b/><b/></a>", tag="b", compact=True))
+        self.assertIsInstance(items[0], untangle.CompactElement)
+
+    def test_copy(self):
+        import copy
+
+        o = untangle.parse("<a><b x='1'>foo</b></a>")
+        self.assertEqual("foo", copy.deepcopy(o).a.b.cdata)
+
+
+class ChildIndexTestCase(unittest.TestCase):
+    """Tests lookup of children by name"""
+
+    def test_add_child_after_lookup(self):
+        o = untangle.parse("<a><b/><c/></a>")
+        self.assertIsInstance(o.a.b, untangle.Element)
+        o.a.add_child(untangle.Element("b", {}))
+        self.assertEqual(2, len(o.a.b))
+        o.a.add_child(untangle.Element("d", {}))
+        self.assertTrue(o.a.d is not None)
+        self.assertEqual(3, len(o.a.get_elements("b") + o.a.get_elements("d")))
+
+    def test_lookup_memoized(self):
+        o = untangle.parse("<a><b/><b/></a>")
+        self.assertIs(o.a.b, o.a.b)
+        self.assertIs(o.a.b, o.a.__dict__["b"])
+        o.a.add_child(untangle.Element("b", {}))
+        self.assertNotIn("b", o.a.__dict__)
+        self.assertEqual(3, len(o.a.b))
+
+    def test_get_elements(self):
+        o = untangle.parse("<a><b/><c/><b/></a>")
+        self.assertEqual(2, len(o.a.get_elements("b")))
+        self.assertEqual([], o.a.get_elements("x"))
+        self.assertEqual(3, len(o.a.get_elements()))
+        o.a.get_elements("b").pop()
+        self.assertEqual(2, len(o.a.get_elements("b")))
+
+    def test_lookup_returns_copy(self):
+        o = untangle.parse("<a><b/><b/></a>")
+        o.a.b.pop()
+        self.assertEqual(2, len(o.a.get_elements("b")))
+        compact = untangle.parse("<a><b/><b/></a>", compact=True)
+        compact.a.b.pop()
+        self.assertEqual(2, len(compact.a.b))
+        self.assertEqual(2, len(compact.a.get_elements("b")))
+
+    def test_hasattribute(self):
+        o = untangle.parse("<a><b/></a>")
+        self.assertTrue(o.a.__hasattribute__("b"))
+        self.assertFalse(o.a.__hasattribute__("c"))
+
+    def test_wide_element(self):
+        xml = "<a>%s</a>" % "".join("<c%d>%d</c%d>" % (i, i, i) for i in range(5000))
+        o = untangle.parse(xml)
+        for i in range(5000):
+            self.assertEqual(str(i), getattr(o.a, "c%d" % i).cdata)
+
+
+class ParserTestCase(unittest.TestCase):
+    """Tests reusable Parser objects"""
+
+    def test_reuse(self):
+        parser = untangle.Parser()
+        for i in range(5):
+            o = parser.parse('<a><b x="%d"/></a>' % i)
+            self.assertEqual(str(i), o.a.b["x"])
+        self.assertEqual("17", parser.parse("tests/res/pom.xml").project.parent.version)
+
+    def test_reuse_after_error(self):
+        parser = untangle.Parser()
+        with self.assertRaises(xml.sax.SAXParseException):
+            parser.parse("<unclosed>")
+        self.assertTrue(parser.parse("<a/>").a is not None)
+        with self.assertRaises(xml.sax.SAXParseException):
+            list(parser.iterparse("<a><b/>", "b"))
+        self.assertEqual(2, len(list(parser.iterparse("<a><b/><b/></a>", "b"))))
+
+    def test_nested_use(self):
+        parser = untangle.Parser()
+        names = []
+        for b in parser.iterparse("<a><b>1</b><b>2</b></a>", "b"):
+            names.append(parser.parse("<c>%s</c>" % b.cdata).c.cdata)
+        self.assertEqual(["1", "2"], names)
+
+    def test_compact(self):
+        o = untangle.Parser(compact=True).parse("<a/>")
+        self.assertIsInstance(o.a, untangle.CompactElement)
+
+    def test_features(self):
+        with self.assertRaises(AttributeError):
+            untangle.Parser(invalid_feature=True)
+        parser = untangle.Parser(feature_external_ges=False)
+        with self.assertRaises(defusedxml.common.ExternalReferenceForbidden):
+            parser.parse(ParserFeatureTestCase.bad_dtd_xml)
+
+    def test_threads(self):
+        import threading
+
+        parser = untangle.Parser()
+        results = []
+
+        def work(i):
+            for j in range(50):
+                o = parser.parse("<a><b>%d</b></a>" % (i * 100 + j))
+                results.append(int(o.a.b.cdata))
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(
+            sorted(i * 100 + j for i in range(4) for j in range(50)), sorted(results)
+        )
+
+
+class BytesInputTestCase(unittest.TestCase):
+    """Tests parsing bytes-like objects"""
+
+    xml = '<a><b x="1">f\xc3\xb6\xc3\xb6</b></a>'.encode("latin-1")
+
+    def test_bytes(self):
+        self.assertEqual("föö", untangle.parse(self.xml).a.b.cdata)
+
+    def test_bytearray(self):
+        self.assertEqual("1", untangle.parse(bytearray(self.xml)).a.b["x"])
+
+    def test_memoryview(self):
+        self.assertEqual("föö", untangle.parse(memoryview(self.xml)).a.b.cdata)
+
+    def test_encoding_declaration(self):
+        xml = '<?xml version="1.0" encoding="ISO-8859-1"?><a>été</a>'
+        o = untangle.parse(xml.encode("iso-8859-1"))
+        self.assertEqual("été", o.a.cdata)
+
+    def test_large_bytes(self):
+        xml = b"<root>" + b"<item>data</item>" * 10000 + b"</root>"
+        self.assertEqual(10000, len(untangle.parse(xml).root.item))
+        self.assertEqual(10000, len(list(untangle.iterparse(xml, tag="item"))))
+
+    def test_mmap(self):
+        import mmap
+
+        with open("tests/res/pom.xml", "rb") as pom_file:
+            data = mmap.mmap(pom_file.fileno(), 0, access=mmap.ACCESS_READ)
+            o = untangle.parse(data)
+            self.assertEqual("17", o.project.parent.version)
+            data.close()
+
+    def test_invalid_bytes(self):
+        with self.assertRaises(xml.sax.SAXParseException):
+            untangle.parse(b"<a><b></a>")
+
+    def test_empty_bytes(self):
+        self.assertRaises(ValueError, untangle.parse, b"")
+        self.assertRaises(ValueError, untangle.parse, memoryview(b""))
+
+
+class MmapTestCase(unittest.TestCase):
+    """Tests parsing memory-mapped files"""
+
+    def test_parse(self):
+        o = untangle.parse("tests/res/pom.xml", mmap=True)
+        self.assertEqual("17", o.project.parent.version)
+        o = untangle.parse("tests/res/unicode.xml", mmap=True)
+        self.assertEqual("ðÒÉ×ÅÔ ÍÉÒ", o.page.menu.name)
+
+    def test_iterparse(self):
+        names = list(untangle.iterparse("tests/res/unicode.xml", "name", mmap=True))
+        self.assertEqual(3, len(names))
+
+    def test_not_a_file(self):
+        o = untangle.parse("<a><b/></a>", mmap=True)
+        self.assertTrue(o.a.b is not None)
+
+    def test_error_names_file(self):
+        with self.assertRaises(defusedxml.common.EntitiesForbidden):
+            untangle.parse("tests/res/xxe.xml", mmap=True)
+        import tempfile
+
+        with tempfile.NamedTemporaryFile("w", suffix=".xml", delete=False) as f:
+            f.write("<a><b></a>")
+        try:
+            with self.assertRaises(xml.sax.SAXParseException) as cm:
+                untangle.parse(f.name, mmap=True)
+            self.assertEqual(f.name, cm.exception.getSystemId())
+        finally:
+            import os
+
+            os.remove(f.name)
+
+
+class PushParserTestCase(unittest.TestCase):
+    """Tests incremental parsing with PushParser"""
+
+    def test_same_tree(self):
+        with open("tests/res/pom.xml", "rb") as pom_file:
+            data = pom_file.read()
+        parser = untangle.PushParser()
+        for i in range(0, len(data), 7):
+            parser.feed(data[i : i + 7])
+        o = parser.close()
+        self.assertEqual("17", o.project.parent.version)
+        self.assertEqual(dir(untangle.parse(data).project), dir(o.project))
+
+    def test_callbacks(self):
+        parser = untangle.PushParser()
+        seen = []
+        parser.on("item", lambda e: seen.append(e["id"]))
+        parser.on("sub_item", lambda e: seen.append(e.cdata))
+        parser.feed('<root><item id="1"/><item id="2"><sub-item>x')
+        self.assertEqual(["1"], seen)
+        parser.feed("</sub-item></item>")
+        self.assertEqual(["1", "x", "2"], seen)
+        parser.feed("</root>")
+        o = parser.close()
+        self.assertEqual(2, len(o.root.item))
+        self.assertIs(o, parser.root)
+
+    def test_compact(self):
+        parser = untangle.PushParser(compact=True)
+        parser.feed("<a/>")
+        self.assertIsInstance(parser.close().a, untangle.CompactElement)
+
+    def test_invalid(self):
+        parser = untangle.PushParser()
+        with self.assertRaises(xml.sax.SAXParseException):
+            parser.feed("<a></b>")
+        parser = untangle.PushParser()
+        parser.feed("<a>")
+        with self.assertRaises(xml.sax.SAXParseException):
+            parser.close()
+        with self.assertRaises(ValueError):
+            parser.feed("</a>")
+
+    def test_xxe(self):
+        with open("tests/res/xxe.xml") as f:
+            data = f.read()
+        parser = untangle.PushParser()
+        with self.assertRaises(defusedxml.common.EntitiesForbidden):
+            parser.feed(data)
+            parser.close()
+
+
+class AsyncTestCase(unittest.TestCase):
+    """Tests parse_async() and iterparse_async()"""
+
+    xml = b"<root>" + b'<item id="1">data</item>' * 20000 + b"</root>"
+
+    @staticmethod
+    def stream_reader(data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return reader
+
+    @staticmethod
+    async def chunks(data, size=1000):
+        for i in range(0, len(data), size):
+            yield data[i : i + size]
+
+    def test_parse_stream_reader(self):
+        async def main():
+            return await untangle.parse_async(self.stream_reader(self.xml))
+
+        o = asyncio.run(main())
+        self.assertEqual(20000, len(o.root.item))
+
+    def test_parse_async_iterable(self):
+        async def main():
+            return await untangle.parse_async(self.chunks(b"<a><b>x</b></a>", 3))
+
+        self.assertEqual("x", asyncio.run(main()).a.b.cdata)
+
+    def test_iterparse(self):
+        async def main():
+            count = 0
+            async for item in untangle.iterparse_async(
+                self.chunks(self.xml, 100000), tag="item"
+            ):
+                self.assertEqual("1", item["id"])
+                count += 1
+            return count
+
+        self.assertEqual(20000, asyncio.run(main()))
+
+    def test_yields_to_event_loop(self):
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        async def main():
+            task = asyncio.ensure_future(ticker())
+            await asyncio.sleep(0)
+            before = len(ticks)
+            await untangle.parse_async(self.stream_reader(self.xml))
+            task.cancel()
+            return len(ticks) - before
+
+        self.assertGreater(asyncio.run(main()), 1)
+
+    def test_errors(self):
+        async def parse(data):
+            return await untangle.parse_async(self.stream_reader(data))
+
+        with self.assertRaises(xml.sax.SAXParseException):
+            asyncio.run(parse(b"<a><b></a>"))
+        with self.assertRaises(ValueError):
+            asyncio.run(parse(b""))
+
+
+class PickleTestCase(unittest.TestCase):
+    """Tests pickling parsed documents"""
+
+    def test_roundtrip(self):
+        o = untangle.parse("tests/res/pom.xml")
+        copy = pickle.loads(pickle.dumps(o))
+        self.assertTrue(copy.is_root)
+        self.assertEqual("17", copy.project.parent.version)
+        self.assertEqual(dir(o.project), dir(copy.project))
+        self.assertEqual("4.0.0", copy.project.modelVersion.cdata)
+
+    def test_compact(self):
+        o = untangle.parse('<a><b x="1">foo</b><b/></a>', compact=True)
+        copy = pickle.loads(pickle.dumps(o.a))
+        self.assertIsInstance(copy, untangle.CompactElement)
+        self.assertFalse(copy.is_root)
+        self.assertEqual("1", copy.b[0]["x"])
+        self.assertEqual("foo", copy.b[0].cdata)
+
+    def test_deep(self):
+        depth = 5000
+        o = untangle.parse("<a>" * depth + "</a>" * depth, backend=DEEP_BACKEND)
+        element = pickle.loads(pickle.dumps(o))
+        for _ in range(depth):
+            element = element.children[0]
+        self.assertEqual([], element.children)
+
+
+class ParseManyTestCase(unittest.TestCase):
+    """Tests parse_many()"""
+
+    sources = ["<a><b>%d</b></a>" % i for i in range(20)] + ["tests/res/pom.xml"]
+
+    def test_process(self):
+        results = list(untangle.parse_many(self.sources, workers=2))
+        self.assertEqual(
+            [str(i) for i in range(20)], [r.a.b.cdata for r in results[:20]]
+        )
+        self.assertEqual("17", results[-1].project.parent.version)
+
+    def test_thread(self):
+        results = untangle.parse_many(self.sources, workers=2, executor="thread")
+        self.assertEqual("0", next(results).a.b.cdata)
+
+    def test_cache_and_indexes(self):
+        cache = untangle.ParseCache()
+        with self.assertRaises(ValueError):
+            untangle.parse_many(self.sources, cache=cache)
+        index = untangle.AttributeIndex("a", "id")
+        with self.assertRaises(ValueError):
+            untangle.parse_many(self.sources, indexes=[index])
+        sources = ["<a id='1'/>", "<a id='2'/>", "<a id='1'/>"]
+        options = {"executor": "thread", "workers": 1}
+        list(untangle.parse_many(sources, cache=cache, **options))
+        self.assertEqual((1, 2), cache.info()[:2])
+        list(untangle.parse_many(sources, indexes=[index], **options))
+        self.assertEqual(2, len(index.getall("1")))
+        self.assertEqual(1, len(index.getall("2")))
+
+    def test_unordered(self):
+        results = untangle.parse_many(self.sources[:20], ordered=False, workers=2)
+        results = dict(results)
+        self.assertEqual(20, len(results))
+        for source, root in results.items():
+            self.assertEqual(source, "<a><b>%s</b></a>" % root.a.b.cdata)
+
+    def test_errors(self):
+        with self.assertRaises(xml.sax.SAXParseException):
+            list(untangle.parse_many(["<a/>", "<a>"], executor="thread"))
+
+    def test_errors_in_processes(self):
+        sources = ["<a/>", "<a>\n<b></a>"]
+        with self.assertRaises(xml.sax.SAXParseException) as expected:
+            untangle.parse(sources[1])
+        with self.assertRaises(xml.sax.SAXParseException) as cm:
+            list(untangle.parse_many(sources, workers=2))
+        self.assertEqual(str(expected.exception), str(cm.exception))
+        self.assertEqual(2, cm.exception.getLineNumber())
+        with self.assertRaises(xml.sax.SAXParseException):
+            list(untangle.parse_many(sources, workers=2, ordered=False))
+        with self.assertRaises(defusedxml.common.EntitiesForbidden) as expected:
+            untangle.parse("tests/res/xxe.xml")
+        with self.assertRaises(defusedxml.common.EntitiesForbidden) as cm:
+            list(untangle.parse_many(["tests/res/xxe.xml"], workers=1))
+        self.assertEqual(str(expected.exception), str(cm.exception))
+        with self.assertRaises(ValueError):
+            untangle.parse_many([], executor="fiber")
+
+
+class PathFilterTestCase(unittest.TestCase):
+    """Tests include/exclude path filters"""
+
+    soap = """<?xml version="1.0"?>
+<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">
+  <soap:Header><Token>secret</Token></soap:Header>
+  <soap:Body>
+    <Result>
+      <Item id="1">one</Item>
+      <Item id="2">two<Debug>x</Debug></Item>
+      <Count>2</Count>
+    </Result>
+    <Trace>lots of data</Trace>
+  </soap:Body>
+</soap:Envelope>"""
+
+    def test_include(self):
+        o = untangle.parse(self.soap, include=["Envelope/Body/Result/Item"])
+        body = o.soap_Envelope.soap_Body
+        self.assertEqual(["soap_Body"], dir(o.soap_Envelope))
+        self.assertEqual(["Result"], dir(body))
+        self.assertEqual(["Item", "Item"], dir(body.Result))
+        self.assertEqual("one", body.Result.Item[0].cdata)
+        self.assertEqual("x", body.Result.Item[1].Debug.cdata)
+        # text outside of the included subtrees is dropped
+        self.assertEqual("", body.Result.cdata)
+
+    def test_include_wildcard(self):
+        o = untangle.parse(self.soap, include=["/soap:Envelope/*/Result/*"])
+        result = o.soap_Envelope.soap_Body.Result
+        self.assertEqual(["Count", "Item", "Item"], dir(result))
+        self.assertEqual("2", result.Count.cdata)
+
+    def test_exclude(self):
+        o = untangle.parse(
+            self.soap, exclude=["Envelope/Header", "Envelope/Body/Result/Item/Debug"]
+        )
+        self.assertEqual(["soap_Body"], dir(o.soap_Envelope))
+        self.assertEqual([], dir(o.soap_Envelope.soap_Body.Result.Item[1]))
+        self.assertEqual("lots of data", o.soap_Envelope.soap_Body.Trace.cdata)
+
+    def test_include_and_exclude(self):
+        o = untangle.parse(
+            self.soap, include=["Envelope/Body/Result"], exclude=["*/*/*/Item"]
+        )
+        self.assertEqual(["Count"], dir(o.soap_Envelope.soap_Body.Result))
+
+    def test_nothing_included(self):
+        o = untangle.parse(self.soap, include=["Other"])
+        self.assertEqual([], dir(o))
+
+    def test_iterparse(self):
+        items = untangle.iterparse(
+            self.soap, tag="Item", exclude=["Envelope/Body/Result/Item/Debug"]
+        )
+        self.assertEqual([[], []], [dir(item) for item in items])
+
+
+class QueryTestCase(unittest.TestCase):
+    """Tests find(), findall() and iterfind()"""
+
+    def setUp(self):
+        self.o = untangle.parse(
+            """<?xml version="1.0"?>
+<rss version="2.0">
+    <channel>
+        <title>Test Feed</title>
+        <item id="1"><title>Item 1</title><dc:creator>me</dc:creator></item>
+        <item id="2"><title>Item 2</title></item>
+        <item id="5" lang="en">
+            <title>Item 5</title>
+            <related><item id="9"><title>Item 9</title></item></related>
+        </item>
+    </channel>
+</rss>"""
+        )
+
+    def ids(self, elements):
+        return [e["id"] for e in elements]
+
+    def test_child_path(self):
+        self.assertEqual("Test Feed", self.o.find("rss/channel/title").cdata)
+        self.assertEqual(["1", "2", "5"], self.ids(self.o.rss.findall("channel/item")))
+        self.assertIsNone(self.o.find("rss/missing"))
+        self.assertEqual([], self.o.findall("rss/missing/item"))
+
+    def test_attribute_predicates(self):
+        self.assertEqual("Item 5", self.o.find("rss/channel/item[@id='5']/title").cdata)
+        self.assertEqual(["5"], self.ids(self.o.findall("rss/*/item[@lang]")))
+        self.assertEqual([], self.o.findall("rss/channel/item[@id='7']"))
+
+    def test_child_predicates(self):
+        channel = self.o.rss.channel
+        self.assertEqual(["1"], self.ids(channel.findall("item[dc:creator]")))
+        self.assertEqual(["2"], self.ids(channel.findall("item[title='Item 2']")))
+        titles = channel.findall("*/title[.='Item 2']")
+        self.assertEqual(["Item 2"], [t.cdata for t in titles])
+
+    def test_positions(self):
+        channel = self.o.rss.channel
+        self.assertEqual(["2"], self.ids(channel.findall("item[2]")))
+        self.assertEqual(["5"], self.ids(channel.findall("item[last()]")))
+        self.assertEqual(["1", "9"], self.ids(self.o.findall(".//item[1]")))
+        self.assertEqual(["5", "9"], self.ids(self.o.findall(".//item[last()]")))
+        self.assertEqual(["2"], self.ids(self.o.findall(".//item[@id][2]")))
+        o = untangle.parse('<r><a><i n="1"/><i n="2"/></a><a><i n="3"/></a></r>')
+        self.assertEqual(["1", "3"], [i["n"] for i in o.findall(".//i[1]")])
+        self.assertEqual(["1", "3"], [i["n"] for i in o.r.findall("a//i[1]")])
+
+    def test_descendants(self):
+        self.assertEqual(["1", "2", "5", "9"], self.ids(self.o.findall(".//item")))
+        self.assertEqual(["9"], self.ids(self.o.findall("//related/item")))
+        self.assertEqual(
+            ["Item 9"], [t.cdata for t in self.o.rss.findall(".//related//title")]
+        )
+
+    def test_iterfind(self):
+        it = self.o.iterfind("rss/channel/item")
+        self.assertEqual("1", next(it)["id"])
+        self.assertEqual(["2", "5"], self.ids(it))
+
+    def test_compact(self):
+        o = untangle.parse("<a><b x='1'/><b x='2'/></a>", compact=True)
+        self.assertEqual("2", o.find("a/b[@x='2']")["x"])
+
+    def test_compiled_once(self):
+        self.assertIs(
+            untangle.compile_query("a/b[@c='d']"), untangle.compile_query("a/b[@c='d']")
+        )
+
+    def test_invalid(self):
+        for path in ("", "/rss", "rss/", "rss/../x", "rss[@id=1]", "rss[0]"):
+            with self.assertRaises(ValueError):
+                self.o.find(path)
+
+
+class AttributeIndexTestCase(unittest.TestCase):
+    """Tests secondary attribute indexes"""
+
+    catalogue = """<catalogue>
+  <product sku="a1"><name>Apple</name></product>
+  <group>
+    <product sku="b2"><name>Banana</name></product>
+    <product sku="a1"><name>Apricot</name></product>
+  </group>
+  <product><name>Unknown</name></product>
+  <price-list><price sku="a1">3</price></price-list>
+</catalogue>"""
+
+    def test_build_index(self):
+        o = untangle.parse(self.catalogue)
+        products = o.build_index("product", "sku")
+        self.assertEqual(2, len(products))
+        self.assertEqual(["a1", "b2"], sorted(products))
+        self.assertEqual("Banana", products["b2"].name.cdata)
+        self.assertEqual("Apple", products["a1"].name.cdata)
+        self.assertIsNone(products.get("c3"))
+        self.assertNotIn("c3", products)
+        with self.assertRaises(KeyError):
+            products["c3"]
+
+    def test_getall(self):
+        products = untangle.parse(self.catalogue).build_index("product", "sku")
+        self.assertEqual(
+            ["Apple", "Apricot"], [p.name.cdata for p in products.getall("a1")]
+        )
+        self.assertEqual([], products.getall("c3"))
+
+    def test_subtree(self):
+        o = untangle.parse(self.catalogue)
+        products = o.catalogue.group.build_index("product", "sku")
+        self.assertEqual("Apricot", products["a1"].name.cdata)
+
+    def test_raw_tag_name(self):
+        o = untangle.parse(self.catalogue)
+        prices = o.build_index("price-list", "sku")
+        self.assertEqual(0, len(prices))
+        self.assertEqual("3", o.build_index("price", "sku")["a1"].cdata)
+
+    def test_parse_time(self):
+        products = untangle.AttributeIndex("product", "sku")
+        prices = untangle.AttributeIndex("price", "sku")
+        o = untangle.parse(self.catalogue, indexes=[products, prices], compact=True)
+        self.assertIs(o.catalogue.product[0], products["a1"])
+        self.assertEqual(2, len(products.getall("a1")))
+        self.assertEqual("3", prices["a1"].cdata)
+
+    def test_parse_time_filtered(self):
+        products = untangle.AttributeIndex("product", "sku")
+        untangle.parse(self.catalogue, indexes=[products], exclude=["*/group"])
+        self.assertEqual(["a1"], list(products))
+        self.assertEqual(1, len(products.getall("a1")))
+
+    def test_parser_accumulates(self):
+        products = untangle.AttributeIndex("product", "sku")
+        parser = untangle.Parser(indexes=[products])
+        parser.parse("<c><product sku='1'/></c>")
+        parser.parse("<c><product sku='2'/></c>")
+        self.assertEqual(["1", "2"], list(products))
+
+
+class SnapshotTestCase(unittest.TestCase):
+    """Tests dump() and load()"""
+
+    def setUp(self):
+        import tempfile
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name + "/pom.snapshot"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertSameTree(self, expected, actual):
+        # compares the flat (class, is_root, names, attributes, cdatas,
+        # sizes) form which elements are pickled as
+        self.assertEqual(expected.__reduce__(), actual.__reduce__())
+
+    def test_round_trip(self):
+        o = untangle.parse("tests/res/pom.xml")
+        untangle.dump(o, self.path)
+        for mmap in (False, True):
+            loaded = untangle.load(self.path, mmap=mmap)
+            self.assertSameTree(o, loaded)
+            self.assertEqual("17", loaded.project.parent.version)
+            self.assertEqual(
+                "http://maven.apache.org/POM/4.0.0", loaded.project["xmlns"]
+            )
+
+    def test_file_objects(self):
+        import io
+
+        o = untangle.parse("tests/res/unicode.xml", compact=True)
+        f = io.BytesIO()
+        untangle.dump(o, f)
+        f.seek(0)
+        loaded = untangle.load(f)
+        self.assertSameTree(o, loaded)
+        self.assertEqual("ðÒÉ×ÅÔ ÍÉÒ", loaded.page.menu.name)
+
+    def test_subtree(self):
+        o = untangle.parse("<a><b x='1'>text<c/></b><b/></a>")
+        untangle.dump(o.a.b[0], self.path)
+        loaded = untangle.load(self.path, mmap=True)
+        self.assertFalse(loaded.is_root)
+        self.assertEqual("1", loaded["x"])
+        self.assertEqual(["c"], dir(loaded))
+        self.assertEqual("text", loaded.cdata)
+
+    def test_shared_attribute_layouts(self):
+        o = untangle.parse("<a><b x='1' y='2'/><b x='3' y='4'/><b y='5'/></a>")
+        untangle.dump(o, self.path)
+        b = untangle.load(self.path).a.b
+        self.assertIs(b[0]._attributes._index, b[1]._attributes._index)
+        self.assertEqual([("y", "5")], list(b[2]._attributes.items()))
+
+    def test_nul_character(self):
+        o = untangle.parse("<a/>")
+        o.a.cdata = "\0"
+        with self.assertRaises(ValueError):
+            untangle.dump(o, self.path)
+
+    def test_invalid(self):
+        for data in (b"", b"<a/>", b"untangle" + b"\xff" * 40):
+            with open(self.path, "wb") as f:
+                f.write(data)
+            with self.assertRaises(ValueError):
+                untangle.load(self.path)
+
+
+class ParseCacheTestCase(unittest.TestCase):
+    """Tests the parse cache"""
+
+    xml = "<a><b x='1'>text</b><b/></a>"
+
+    def test_hits_and_misses(self):
+        cache = untangle.ParseCache()
+        first = untangle.parse(self.xml, cache=cache)
+        second = untangle.parse(self.xml, cache=cache)
+        self.assertIsNot(first, second)
+        self.assertEqual(first.__reduce__(), second.__reduce__())
+        self.assertEqual("1", second.a.b[0]["x"])
+        self.assertTrue(second.is_root)
+        untangle.parse(self.xml.encode(), cache=cache)
+        info = cache.info()
+        self.assertEqual((1, 2, 0, 2), info[:4])
+        self.assertGreater(info.size, 0)
+
+    def test_copies_are_independent(self):
+        cache = untangle.ParseCache()
+        untangle.parse(self.xml, cache=cache).a.b[0].cdata = "changed"
+        self.assertEqual("text", untangle.parse(self.xml, cache=cache).a.b[0].cdata)
+
+    def test_shared(self):
+        cache = untangle.ParseCache(copy=False)
+        first = untangle.parse(self.xml, cache=cache, compact=True)
+        self.assertIs(first, untangle.parse(self.xml, cache=cache, compact=True))
+
+    def test_options_are_part_of_the_key(self):
+        cache = untangle.ParseCache()
+        untangle.parse(self.xml, cache=cache)
+        o = untangle.parse(self.xml, cache=cache, compact=True)
+        self.assertIsInstance(o, untangle.CompactElement)
+        o = untangle.parse(self.xml, cache=cache, exclude=["a/b"])
+        self.assertEqual([], dir(o.a))
+        self.assertEqual(0, cache.info().hits)
+
+    def test_files(self):
+        import os
+        import tempfile
+
+        cache = untangle.ParseCache()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "doc.xml")
+            with open(path, "w") as f:
+                f.write("<a>1</a>")
+            self.assertEqual("1", untangle.parse(path, cache=cache).a.cdata)
+            self.assertEqual("1", untangle.parse(path, cache=cache).a.cdata)
+            with open(path, "w") as f:
+                f.write("<a>22</a>")
+            self.assertEqual("22", untangle.parse(path, cache=cache).a.cdata)
+        self.assertEqual((1, 2), cache.info()[:2])
+
+    def test_not_cached(self):
+        import io
+
+        cache = untangle.ParseCache()
+        untangle.parse(io.StringIO(self.xml), cache=cache)
+        self.assertEqual(0, len(cache))
+
+    def test_eviction(self):
+        # room for two documents of a root and one element each
+        cache = untangle.ParseCache(max_size=4 * untangle.ParseCache.ELEMENT_SIZE)
+        untangle.parse("<a/>", cache=cache)
+        untangle.parse("<b/>", cache=cache)
+        untangle.parse("<a/>", cache=cache)
+        untangle.parse("<c/>", cache=cache)
+        self.assertEqual((1, 3, 1, 2), cache.info()[:4])
+        self.assertEqual("a", untangle.parse("<a/>", cache=cache).a._name)
+        self.assertEqual(2, cache.info().hits)
+        # too large to be cached at all
+        untangle.parse(self.xml, cache=cache)
+        self.assertEqual(2, len(cache))
+        cache.clear()
+        self.assertEqual((0, 0), cache.info()[3:5])
+
+    def test_indexes(self):
+        with self.assertRaises(ValueError):
+            untangle.parse(
+                self.xml,
+                cache=untangle.ParseCache(),
+                indexes=[untangle.AttributeIndex("b", "x")],
+            )
+
+
+class DeepDocumentTestCase(unittest.TestCase):
+    """Tests iterative traversal and max_depth"""
+
+    def deep(self, depth):
+        return "<a>" * depth + "text" + "</a>" * depth
+
+    def test_iter(self):
+        o = untangle.parse("<a><b><c/></b><c x='1'/><d-e/></a>")
+        self.assertEqual([None, "a", "b", "c", "c", "d_e"], [e._name for e in o.iter()])
+        self.assertEqual([None, "1"], [c["x"] for c in o.iter("c")])
+        self.assertEqual(["c"], [e._name for e in o.a.b.iter("c")])
+        self.assertEqual(1, len(list(o.iter("d-e"))))
+        self.assertEqual([], list(o.iter("x")))
+
+    def test_deeper_than_recursion_limit(self):
+        import sys
+
+        depth = sys.getrecursionlimit() * 2
+        o = untangle.parse(self.deep(depth), backend=DEEP_BACKEND)
+        elements = list(o.a.iter("a"))
+        self.assertEqual(depth, len(elements))
+        self.assertEqual("text", elements[-1].cdata)
+        self.assertIn("Element <a>", str(o.a))
+        self.assertEqual(depth + 1, len(list(pickle.loads(pickle.dumps(o)).iter())))
+
+    def test_max_depth(self):
+        o = untangle.parse(self.deep(5), max_depth=5)
+        self.assertEqual(5, len(list(o.iter("a"))))
+        with self.assertRaises(xml.sax.SAXParseException) as cm:
+            untangle.parse("<a>\n" + self.deep(5) + "</a>", max_depth=5)
+        self.assertIn("maximum depth of 5 exceeded", str(cm.exception))
+        if untangle.DEFAULT_BACKEND != "lxml":
+            # lxml only reports positions of syntax errors
+            self.assertEqual(2, cm.exception.getLineNumber())
+
+    def test_max_depth_in_skipped_subtrees(self):
+        xml_string = "<r><x>%s</x></r>" % self.deep(5)
+        with self.assertRaises(xml.sax.SAXParseException):
+            untangle.parse(xml_string, max_depth=5, include=["r/y"])
+
+    def test_max_depth_iterparse(self):
+        items = untangle.iterparse(self.deep(10), "a", max_depth=3)
+        with self.assertRaises(xml.sax.SAXParseException):
+            list(items)
+
+
+class ExpatBackendTestCase(unittest.TestCase):
+    """Tests backend="expat" against the default SAX backend"""
+
+    backend = "expat"
+
+    documents = [
+        "tests/res/pom.xml",
+        "tests/res/figs.xml",
+        "tests/res/unicode.xml",
+        "tests/res/some.xslt",
+        b'<?xml version="1.0" encoding="ISO-8859-1"?><a b="\xe9">\xe9</a>',
+        "<a>one &amp; two<!-- c --><![CDATA[ <three> ]]>\n four<b/> five</a>",
+        '<soap:Envelope xmlns:soap="urn:s"><soap:Body x:y="1"/></soap:Envelope>',
+        '<a k="x&amp;y &lt;&#38;" p:q="1"><p:b r:s="2">&amp;</p:b><c/></a>',
+        "<r>%s</r>" % ('<x:a y:b="1">t</x:a>' * 150),
+    ]
+
+    def assertParity(self, source, **options):
+        expected = untangle.parse(source, **options)
+        actual = untangle.parse(source, backend=self.backend, **options)
+        self.assertEqual(expected.__reduce__(), actual.__reduce__())
+
+    def test_parity(self):
+        for source in self.documents:
+            self.assertParity(source)
+            self.assertParity(source, compact=True, strip_whitespace=True)
+
+    def test_parity_options(self):
+        self.assertParity("tests/res/pom.xml", mmap=True, include=["project/*"])
+        self.assertParity("tests/res/pom.xml", exclude=["*/dependencies"])
+
+    def test_iterparse(self):
+        expected = untangle.iterparse("tests/res/unicode.xml", "name")
+        actual = untangle.iterparse(
+            "tests/res/unicode.xml", "name", backend=self.backend
+        )
+        self.assertEqual([e.cdata for e in expected], [a.cdata for a in actual])
+
+    def test_push_parser(self):
+        parser = untangle.PushParser(backend=self.backend)
+        parser.feed(b"<a><b>1")
+        parser.feed("</b></a>")
+        self.assertEqual("1", parser.close().a.b.cdata)
+
+    def test_reader_reused(self):
+        parser = untangle.Parser(backend=self.backend)
+        self.assertEqual("1", parser.parse("<a>1</a>").a.cdata)
+        self.assertEqual("2", parser.parse(b"<a>2</a>").a.cdata)
+
+    def test_forbidden(self):
+        with self.assertRaises(defusedxml.common.EntitiesForbidden):
+            untangle.parse("tests/res/xxe.xml", backend=self.backend)
+        with self.assertRaises(defusedxml.common.ExternalReferenceForbidden):
+            untangle.parse(
+                ParserFeatureTestCase.bad_dtd_xml,
+                backend=self.backend,
+                feature_external_ges=True,
+            )
+        bomb = '<!DOCTYPE a [<!ENTITY x "xx">]><a>&x;&x;</a>'
+        with self.assertRaises(defusedxml.common.EntitiesForbidden):
+            untangle.parse(bomb, backend=self.backend)
+
+    def test_forbidden_utf16(self):
+        bomb = '<!DOCTYPE a [<!ENTITY x "xx">]><a>&x;&x;</a>'.encode("utf-16")
+        with self.assertRaises(defusedxml.common.EntitiesForbidden):
+            untangle.parse(bomb, backend=self.backend)
+
+    def test_errors(self):
+        with self.assertRaises(xml.sax.SAXParseException) as cm:
+            untangle.parse("<a>\n<b></a>", backend=self.backend)
+        self.assertEqual(2, cm.exception.getLineNumber())
+        self.assertEqual("mismatched tag", cm.exception.getMessage())
+        with self.assertRaises(xml.sax.SAXParseException):
+            untangle.parse("<a>", backend=self.backend)
+        with self.assertRaises(xml.sax.SAXParseException):
+            untangle.parse("<a/>", backend=self.backend, max_depth=0)
+
+    def test_features(self):
+        with self.assertRaises(xml.sax.SAXNotSupportedException):
+            untangle.parse("<a/>", backend=self.backend, feature_namespaces=True)
+        o = untangle.parse("<a/>", backend=self.backend, feature_validation=0)
+        self.assertTrue(o)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            untangle.parse("<a/>", backend="lxml2")
+
+
+@unittest.skipIf(untangle.lxml is None, "lxml is not installed")
+class LxmlBackendTestCase(ExpatBackendTestCase):
+    """Tests backend="lxml" against the default SAX backend"""
+
+    backend = "lxml"
+
+    def test_errors(self):
+        with self.assertRaises(xml.sax.SAXParseException) as cm:
+            untangle.parse("<a>\n<b></a>", backend="lxml")
+        self.assertEqual(2, cm.exception.getLineNumber())
+        with self.assertRaises(xml.sax.SAXParseException):
+            untangle.parse("<a>", backend="lxml")
+        with self.assertRaises(xml.sax.SAXParseException):
+            untangle.parse("<a/>", backend="lxml", max_depth=0)
+
+    def test_forbidden_utf16(self):
+        bomb = '<!DOCTYPE a [<!ENTITY x "xx">]><a>&x;&x;</a>'
+        with self.assertRaises(ValueError):
+            untangle.parse(bomb.encode("utf-16"), backend="lxml")
+        utf7 = (
+            b'<?xml version="1.0" encoding="UTF-7"?>'
+            b'+ADw-!DOCTYPE a +AFs-+ADw-!ENTITY x "xx"+AD4-+AF0-+AD4-<a>&x;</a>'
+        )
+        with self.assertRaises(ValueError):
+            untangle.parse(utf7, backend="lxml")
+
+    def test_limits(self):
+        deep = "<a>" * 300 + "</a>" * 300
+        with self.assertRaises(xml.sax.SAXParseException):
+            untangle.parse(deep, backend="lxml")
+
+    def test_namespace_declarations(self):
+        o = untangle.parse(
+            '<a xmlns="urn:a" xmlns:b="urn:b" b:c="1"><b:d xml:lang="en"/></a>',
+            backend="lxml",
+        )
+        self.assertEqual("urn:a", o.a["xmlns"])
+        self.assertEqual("urn:b", o.a["xmlns:b"])
+        self.assertEqual("1", o.a["b:c"])
+        self.assertEqual("en", o.a.b_d["xml:lang"])
+
+
+class BackendFallbackTestCase(unittest.TestCase):
+    """Tests backend="lxml" without lxml"""
+
+    def setUp(self):
+        self.lxml = untangle.lxml
+        untangle.lxml = None
+
+    def tearDown(self):
+        untangle.lxml = self.lxml
+
+    def test_fallback(self):
+        parser = untangle.Parser(backend="lxml")
+        self.assertEqual("expat", parser.backend)
+        self.assertEqual("1", parser.parse("<a>1</a>").a.cdata)
+
+
+class LazyTestCase(unittest.TestCase):
+    """Tests parse(lazy=True)"""
+
+    documents = ExpatBackendTestCase.documents + [
+        "<a x='>' y=\"'\">one<b z='/>'/>two<c>three</c >four<d><e/></d>\n</a>",
+        "<a>" + "".join("<b i='%d'>%d</b>" % (i, i) for i in range(100)) + "</a>",
+    ]
+
+    def assertParity(self, source, **options):
+        expected = untangle.parse(source, backend="sax", **options)
+        actual = untangle.parse(source, lazy=True, **options)
+        self.assertEqual(expected.__reduce__(), actual.__reduce__())
+
+    def assertBuilt(self, element, slot, built=True):
+        # reads the slot without building it
+        try:
+            getattr(untangle.CompactElement, slot).__get__(element)
+        except AttributeError:
+            self.assertFalse(built, slot)
+        else:
+            self.assertTrue(built, slot)
+
+    def test_parity(self):
+        for source in self.documents:
+            self.assertParity(source)
+        self.assertParity("tests/res/pom.xml", mmap=True)
+
+    def test_parity_small_chunks(self):
+        chunk_size = untangle.MMAP_CHUNK_SIZE
+        untangle.MMAP_CHUNK_SIZE = 3
+        try:
+            for source in self.documents:
+                self.assertParity(source)
+        finally:
+            untangle.MMAP_CHUNK_SIZE = chunk_size
+
+    def test_built_on_demand(self):
+        o = untangle.parse("<a><b x='1'>one</b><b x='2'>two<c/></b></a>", lazy=True)
+        self.assertBuilt(o, "children", False)
+        first, second = o.a.b
+        self.assertBuilt(o.a, "_attributes", False)
+        self.assertEqual("1", first["x"])
+        self.assertBuilt(first, "_cdata", False)
+        self.assertEqual("two", second.cdata)
+        self.assertBuilt(second, "children", False)
+        self.assertBuilt(second, "_attributes", False)
+        self.assertIs(o.a.b[0], first)
+
+    def test_modify(self):
+        o = untangle.parse("<a><b/></a>", lazy=True)
+        o.a.add_child(untangle.Element("c", None))
+        o.a.b.cdata = "text"
+        self.assertEqual(["b", "c"], dir(o.a))
+        self.assertEqual("text", o.a.b.cdata)
+
+    def test_pickle(self):
+        o = pickle.loads(pickle.dumps(untangle.parse("tests/res/pom.xml", lazy=True)))
+        self.assertIs(untangle.Element, type(o))
+        self.assertEqual("17", o.project.parent.version)
+
+    def test_max_depth(self):
+        deep = "<a>\n" + "<a>" * 5 + "</a>" * 6
+        self.assertTrue(untangle.parse(deep, lazy=True, max_depth=6))
+        with self.assertRaises(xml.sax.SAXParseException) as cm:
+            untangle.parse(deep, lazy=True, max_depth=5)
+        self.assertEqual(2, cm.exception.getLineNumber())
+
+    def test_errors(self):
+        with self.assertRaises(xml.sax.SAXParseException) as cm:
+            untangle.parse("<a>\n<b></a>", lazy=True)
+        self.assertEqual(2, cm.exception.getLineNumber())
+        with self.assertRaises(defusedxml.common.EntitiesForbidden):
+            untangle.parse("tests/res/xxe.xml", lazy=True)
+        with self.assertRaises(ValueError):
+            untangle.parse("<a/>".encode("utf-16"), lazy=True)
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            untangle.parse("<a/>", lazy=True, compact=True)
+        with self.assertRaises(xml.sax.SAXNotSupportedException):
+            untangle.parse("<a/>", lazy=True, feature_namespaces=True)
+        with self.assertRaises(ValueError):
+            list(untangle.iterparse("<a/>", "a", lazy=True))
+        with self.assertRaises(ValueError):
+            untangle.PushParser(lazy=True)
+
+
+class ExtractColumnsTestCase(unittest.TestCase):
+    """Tests extract_columns()"""
+
+    xml = """<feed>
+      <row id="1" kind="a"><price>1.5</price><name>x &amp; y</name></row>
+      <row id="2"><name>z<b/>!</name><tags><tag>t</tag><tag>u</tag></tags></row>
+      <other><row id="3"><row id="4"/><full-name>w</full-name>own</row></other>
+    </feed>"""
+
+    def test_fields(self):
+        columns = untangle.extract_columns(
+            self.xml,
+            "row",
+            {
+                "id": "@id",
+                "kind": "@kind",
+                "name": "name",
+                "tag": "tags/tag",
+                "full": "full_name",
+                "own": ".",
+            },
+        )
+        self.assertEqual(["id", "kind", "name", "tag", "full", "own"], list(columns))
+        self.assertEqual(["1", "2", "3"], columns["id"])
+        self.assertEqual(["a", None, None], columns["kind"])
+        self.assertEqual(["x & y", "z!", None], columns["name"])
+        self.assertEqual([None, "t", None], columns["tag"])
+        self.assertEqual([None, None, "w"], columns["full"])
+        self.assertEqual(["", "", "own"], columns["own"])
+
+    def test_types(self):
+        columns = untangle.extract_columns(
+            self.xml,
+            "row",
+            {
+                "id": ("@id", "q"),
+                "price": ("price", "d", -1.0),
+                "name": ("name", str.upper, ""),
+            },
+        )
+        self.assertEqual(array.array("q", [1, 2, 3]), columns["id"])
+        self.assertEqual(array.array("d", [1.5, -1.0, -1.0]), columns["price"])
+        self.assertEqual(["X & Y", "Z!", ""], columns["name"])
+
+    def test_invalid_values(self):
+        with self.assertRaises(ValueError) as cm:
+            untangle.extract_columns(self.xml, "row", {"price": ("price", "d")})
+        self.assertIn("record 1 has no value for 'price'", str(cm.exception))
+        with self.assertRaises(ValueError):
+            untangle.extract_columns(self.xml, "row", {"kind": ("@kind", "i", 0)})
+
+    def test_invalid_fields(self):
+        for field in ("", "@", "a/@", "@a/b", ("a", "u"), ("a", "i", 0, 1)):
+            with self.assertRaises((ValueError, TypeError)):
+                untangle.extract_columns(self.xml, "row", {"x": field})
+
+    def test_parser(self):
+        parser = untangle.Parser(mmap=True)
+        for _ in range(2):
+            columns = parser.extract_columns(
+                "tests/res/pom.xml", "parent", {"version": ("version", "i")}
+            )
+            self.assertEqual(array.array("i", [17]), columns["version"])
+
+    def test_max_depth(self):
+        with self.assertRaises(xml.sax.SAXParseException):
+            untangle.extract_columns(self.xml, "row", {"id": "@id"}, max_depth=3)
+
+
+@dataclasses.dataclass(slots=True)
+class Tag:
+    name: str = dataclasses.field(metadata={"untangle": "."})
+    weight: int | None = None
+
+
+@dataclasses.dataclass(slots=True)
+class Item:
+    id: int
+    name: str
+    price: float
+    active: bool = False
+    tags: list[Tag] = dataclasses.field(
+        default_factory=list, metadata={"untangle": "tag"}
+    )
+    notes: list[str] = dataclasses.field(
+        default_factory=list, metadata={"untangle": "note"}
+    )
+    full_name: str | None = None
+    parent: "Item | None" = None
+
+
+@dataclasses.dataclass(slots=True)
+class Feed:
+    title: str
+    item: list[Item]
+
+
+class SchemaTestCase(unittest.TestCase):
+    """Tests parse(schema=...)"""
+
+    xml = """<feed title="t">
+      <item id="1" active="true"><name>a &amp; b</name><price> 1.5 </price>
+        <tag weight="3">x</tag><tag>y</tag><note>n1</note><note>n2</note>
+        <full-name>F</full-name><name>ignored</name>
+        <parent id="2"><name>p</name><price>2</price></parent>
+      </item>
+      <item id="3"><name>c<b>d</b></name><price>3</price><x><item/></x></item>
+    </feed>"""
+
+    def test_bind(self):
+        feed = untangle.parse(self.xml, schema=Feed)
+        first, second = feed.item
+        self.assertEqual("t", feed.title)
+        self.assertEqual(1, first.id)
+        self.assertEqual("a & b", first.name)
+        self.assertEqual(1.5, first.price)
+        self.assertIs(True, first.active)
+        self.assertEqual([Tag("x", 3), Tag("y")], first.tags)
+        self.assertEqual(["n1", "n2"], first.notes)
+        self.assertEqual("F", first.full_name)
+        self.assertEqual(Item(2, "p", 2.0), first.parent)
+        self.assertEqual(Item(3, "c", 3.0), second)
+
+    def test_iterparse(self):
+        items = list(untangle.iterparse(self.xml, "item", schema=Item))
+        self.assertEqual([1, 3], [item.id for item in items])
+        self.assertEqual(untangle.parse(self.xml, schema=Feed).item, items)
+
+    def test_strip_whitespace(self):
+        tag = untangle.parse("<tag>\n  x\n</tag>", schema=Tag, strip_whitespace=True)
+        self.assertEqual("x", tag.name)
+
+    def test_invalid_values(self):
+        with self.assertRaises(ValueError) as cm:
+            untangle.parse("<item id='x'/>", schema=Item)
+        self.assertIn("'id' of Item", str(cm.exception))
+        with self.assertRaises(ValueError):
+            untangle.parse("<item id='1' active='yes'/>", schema=Item)
+        with self.assertRaises(ValueError) as cm:
+            untangle.parse("<item id='1'><name/></item>", schema=Item)
+        self.assertIn("missing value for field 'price'", str(cm.exception))
+
+    def test_invalid_schemas(self):
+        @dataclasses.dataclass
+        class Invalid:
+            items: list[str] = dataclasses.field(metadata={"untangle": "@items"})
+
+        with self.assertRaises(ValueError):
+            untangle.Parser(schema=Invalid)
+        with self.assertRaises(TypeError):
+            untangle.Parser(schema=dict)
+        with self.assertRaises(ValueError):
+            untangle.Parser(schema=Item, compact=True)
+        with self.assertRaises(ValueError):
+            untangle.PushParser(schema=Item)
+
+    def test_plan_cached(self):
+        self.assertIs(untangle._schema_plan(Feed), untangle._schema_plan(Feed))
+
 
 if __name__ == "__main__":
     unittest.main()